@@ -0,0 +1,230 @@
+"""
+Command line entry points for maintenance jobs.
+
+Usage:
+    python -m app.cli import --email user@example.com exports/history.csv
+    python -m app.cli rollups check
+    python -m app.cli rollups rebuild [--email user@example.com]
+    python -m app.cli factors list
+    python -m app.cli factors publish factors.json [--description "..."]
+    python -m app.cli factors recalculate [--chunk-size 1000] [--pause 0.1]
+    python -m app.cli recommendations precompute [--workers 4] [--chunk-size 1000] [--restart]
+    python -m app.cli serialization benchmark [--rows 1000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+from sqlmodel import Session, select
+
+from app.database import create_db_and_tables, engine
+from app.models import User
+from app.services.importer import import_emissions, detect_format, IMPORT_FORMATS, IMPORT_CHUNK_SIZE
+from app.services.precompute import precompute_recommendations, PRECOMPUTE_CHUNK_SIZE
+from app.services.recommendations import invalidate_recommendations
+from app.services.rollups import check_rollups, rebuild_rollups
+from app.services.serialization import benchmark_serialization
+from app.services.factors import (
+    ensure_factor_registry,
+    list_factor_versions,
+    publish_factor_version,
+    recalculate_entries,
+    RECALC_CHUNK_SIZE,
+)
+
+def _read_checkpoint(path: str) -> int:
+    """Return the committed record offset stored in a checkpoint file."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+def _write_checkpoint(path: str, offset: int):
+    """Atomically persist the committed record offset."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(offset))
+    os.replace(tmp_path, path)
+
+def run_import(args) -> int:
+    """Import a CSV/NDJSON file for one user, resuming from the checkpoint file."""
+    fmt = args.format or detect_format(args.path)
+    if fmt not in IMPORT_FORMATS:
+        print("Cannot detect format, pass --format csv|ndjson", file=sys.stderr)
+        return 2
+
+    checkpoint = args.checkpoint or f"{args.path}.progress"
+    resume_from = _read_checkpoint(checkpoint)
+    if resume_from:
+        print(f"Resuming after record {resume_from}", file=sys.stderr)
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.email == args.email)).first()
+        if not user:
+            print(f"User not found: {args.email}", file=sys.stderr)
+            return 1
+
+        def on_progress(report):
+            _write_checkpoint(checkpoint, report["records_committed"])
+            print(
+                f"chunk {report['chunks_committed']}: {report['records_committed']} records, "
+                f"{report['created']} created, {report['failed']} failed",
+                file=sys.stderr
+            )
+
+        with open(args.path, "rb") as stream:
+            report = import_emissions(
+                session,
+                user.id,
+                stream,
+                fmt,
+                resume_from=resume_from,
+                chunk_size=args.chunk_size,
+                on_progress=on_progress
+            )
+        # Only reaches workers through a shared (sqlite) recommendation cache
+        invalidate_recommendations(user.id)
+
+    for error in report["errors"]:
+        print(f"record {error['index']}: {error['detail']}", file=sys.stderr)
+    print(f"Imported {report['created']} entries ({report['failed']} failed)")
+
+    # Finished cleanly, the next run starts from scratch
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return 0
+
+def run_rollups(args) -> int:
+    """Check daily rollups against raw entries, or rebuild them."""
+    create_db_and_tables()
+    with Session(engine) as session:
+        user_id = None
+        if args.email:
+            user = session.exec(select(User).where(User.email == args.email)).first()
+            if not user:
+                print(f"User not found: {args.email}", file=sys.stderr)
+                return 1
+            user_id = user.id
+
+        if args.action == "rebuild":
+            written = rebuild_rollups(session, user_id)
+            invalidate_recommendations(user_id)
+            print(f"Rebuilt {written} rollup rows")
+            return 0
+
+        mismatches = check_rollups(session, user_id)
+        for mismatch in mismatches:
+            user, day, category = mismatch["key"]
+            print(
+                f"{user} {day} {category}: expected {mismatch['expected']}, found {mismatch['actual']}",
+                file=sys.stderr
+            )
+        print(f"{len(mismatches)} rollup mismatches")
+        return 1 if mismatches else 0
+
+def run_factors(args) -> int:
+    """List, publish or apply emission factor versions."""
+    create_db_and_tables()
+    with Session(engine) as session:
+        ensure_factor_registry(session)
+
+        if args.action == "list":
+            for version in list_factor_versions(session):
+                marker = "*" if version.is_active else " "
+                print(f"{marker} {version.id}  {version.created_at:%Y-%m-%d %H:%M}  {version.description}")
+            return 0
+
+        if args.action == "publish":
+            if not args.path:
+                print("publish needs a JSON file of {category: {subcategory: factor}}", file=sys.stderr)
+                return 2
+            with open(args.path) as f:
+                factors = json.load(f)
+            try:
+                version = publish_factor_version(session, factors, args.description or args.path)
+            except ValueError as e:
+                print(str(e), file=sys.stderr)
+                return 1
+            print(f"Published and activated factor version {version.id}")
+            return 0
+
+        def on_progress(report):
+            print(
+                f"chunk {report['chunks_committed']}: {report['scanned']} scanned, "
+                f"{report['updated']} updated, {report['skipped']} skipped",
+                file=sys.stderr
+            )
+
+        report = recalculate_entries(session, chunk_size=args.chunk_size, pause=args.pause, on_progress=on_progress)
+        print(f"Recalculated {report['updated']} entries with factor version {report['version']}")
+        return 0
+
+def run_recommendations(args) -> int:
+    """Precompute today's recommendations for every user (resumes unless --restart)."""
+    create_db_and_tables()
+
+    def on_progress(report):
+        print(f"{report['users']} users in {report['chunks_committed']} chunks", file=sys.stderr)
+
+    report = precompute_recommendations(
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        restart=args.restart,
+        on_progress=on_progress
+    )
+    print(f"Precomputed recommendations for {report['users']} users ({report['day']})")
+    return 0
+
+def run_serialization(args) -> int:
+    """Compare response_model serialization with the fast JSON path."""
+    report = benchmark_serialization(rows=args.rows, repeat=args.repeat)
+    print(f"{report['rows']} rows, encoder {report['encoder']}")
+    print(f"response_model: {report['standard_ms_per_1000']} ms per 1,000 rows")
+    print(f"fast path:      {report['fast_ms_per_1000']} ms per 1,000 rows ({report['speedup']}x)")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Bulk import emissions from CSV or NDJSON")
+    import_parser.add_argument("path", help="CSV or NDJSON file")
+    import_parser.add_argument("--email", required=True, help="Owner of the imported entries")
+    import_parser.add_argument("--format", choices=IMPORT_FORMATS)
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    import_parser.add_argument("--checkpoint", help="Progress file (default: <path>.progress)")
+    import_parser.set_defaults(handler=run_import)
+
+    rollups_parser = commands.add_parser("rollups", help="Check or rebuild daily emission rollups")
+    rollups_parser.add_argument("action", choices=("check", "rebuild"))
+    rollups_parser.add_argument("--email", help="Limit to one user")
+    rollups_parser.set_defaults(handler=run_rollups)
+
+    factors_parser = commands.add_parser("factors", help="Manage emission factor versions")
+    factors_parser.add_argument("action", choices=("list", "publish", "recalculate"))
+    factors_parser.add_argument("path", nargs="?", help="JSON factor table (publish)")
+    factors_parser.add_argument("--description", help="Note stored with a published version")
+    factors_parser.add_argument("--chunk-size", type=int, default=RECALC_CHUNK_SIZE)
+    factors_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+    factors_parser.set_defaults(handler=run_factors)
+
+    recommendations_parser = commands.add_parser("recommendations", help="Precompute recommendations for all users")
+    recommendations_parser.add_argument("action", choices=("precompute",))
+    recommendations_parser.add_argument("--workers", type=int, default=1, help="Processes splitting the user-id space")
+    recommendations_parser.add_argument("--chunk-size", type=int, default=PRECOMPUTE_CHUNK_SIZE)
+    recommendations_parser.add_argument("--restart", action="store_true", help="Redo users already precomputed today")
+    recommendations_parser.set_defaults(handler=run_recommendations)
+
+    serialization_parser = commands.add_parser("serialization", help="Benchmark list response serialization")
+    serialization_parser.add_argument("action", choices=("benchmark",))
+    serialization_parser.add_argument("--rows", type=int, default=1000, help="Entries per response")
+    serialization_parser.add_argument("--repeat", type=int, default=20, help="Timed runs per path")
+    serialization_parser.set_defaults(handler=run_serialization)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
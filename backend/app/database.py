@@ -1,7 +1,15 @@
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, exc, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from pydantic_settings import BaseSettings
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
 import os
+import threading
+import time
 
 class Settings(BaseSettings):
     """Application settings from environment variables."""
@@ -10,32 +18,233 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
     FRONTEND_URL: str = "http://localhost:5173"
+    DB_POOL_SIZE: int = 5  # persistent connections per engine
+    DB_MAX_OVERFLOW: int = 10  # extra connections allowed under load
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # reconnect connections older than this (-1 never)
+    DB_POOL_TIMEOUT_SECONDS: float = 30  # wait for a free connection before failing
+    SQLITE_MMAP_SIZE: int = 268435456  # bytes of the database file memory-mapped
+    SQLITE_CACHE_SIZE_KIB: int = 65536  # page cache per connection
+    TOKEN_CACHE_SIZE: int = 4096  # verified JWTs kept in memory, 0 disables
+    USER_CACHE_TTL_SECONDS: int = 30  # user-existence cache, 0 disables
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB per hash
+    ARGON2_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 1  # processes dedicated to argon2
+    PASSWORD_HASH_MAX_PENDING: int = 8  # queued + running hashes before 503
+    RECOMMENDATION_CACHE_BACKEND: str = "memory"  # memory (per worker) or sqlite (shared file)
+    RECOMMENDATION_CACHE_PATH: str = "./recommendation_cache.db"  # sqlite backend only
+    RECOMMENDATION_CACHE_SIZE: int = 10000  # users cached, 0 disables
+    FAST_JSON_RESPONSES: bool = False  # history/breakdown encode rows directly (orjson when installed)
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes; smaller bodies are sent uncompressed
+    GZIP_COMPRESS_LEVEL: int = 6  # 1 (fastest) - 9 (smallest)
+    BROTLI_QUALITY: int = 4  # 0 - 11; br is offered only when the brotli package is installed
 
     class Config:
         env_file = ".env"
 
 settings = Settings()
 
-# Create engine based on database URL
-if "sqlite" in settings.DATABASE_URL:
+class PoolStats:
+    """Connection checkouts and time spent waiting for a free connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+class _TimedPoolMixin:
+    """Times each checkout: the wait for a free connection, or opening a new one."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _pool_args(poolclass) -> dict:
+    """QueuePool arguments shared by every pooled engine."""
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    }
+
+def _async_database_url(url: str) -> str:
+    """Map a sync driver URL to its asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+IS_SQLITE = "sqlite" in settings.DATABASE_URL
+IS_SQLITE_MEMORY = IS_SQLITE and make_url(settings.DATABASE_URL).database in (None, "", ":memory:")
+
+# In-memory SQLite (DATABASE_URL=sqlite://) shared by the sync and async engines
+SQLITE_SHARED_MEMORY_URI = "file:carbon_tracker?mode=memory&cache=shared&uri=true"
+
+# Create engines based on database URL. The async engine serves request
+# handlers; the sync engine serves the CLI, migrations, streaming export,
+# file import and background jobs. Every pooled engine uses a timed QueuePool;
+# in-memory SQLite (tests, throwaway dev runs) is the one exception.
+if IS_SQLITE_MEMORY:
+    # A plain :memory: database is private to its connection, so each engine
+    # would get its own empty one. Both open the same named shared-cache
+    # database instead; it lives as long as either StaticPool connection, so
+    # neither engine may use a pool that closes idle connections.
     engine = create_engine(
-        settings.DATABASE_URL,
+        f"sqlite:///{SQLITE_SHARED_MEMORY_URI}",
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
     )
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{SQLITE_SHARED_MEMORY_URI}",
+        poolclass=StaticPool,
+    )
+elif IS_SQLITE:
+    # One connection per concurrent session; WAL (below) lets readers run
+    # alongside the single writer instead of queueing behind it
+    engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **_pool_args(TimedQueuePool),
+    )
+    # aiosqlite defaults to NullPool, which opens a connection (and thread) per session
+    async_engine = create_async_engine(
+        _async_database_url(settings.DATABASE_URL),
+        **_pool_args(TimedAsyncQueuePool),
+    )
 else:
     engine = create_engine(
         settings.DATABASE_URL,
         echo=False,
         future=True,
         pool_pre_ping=True,
+        **_pool_args(TimedQueuePool),
     )
+    async_engine = create_async_engine(
+        _async_database_url(settings.DATABASE_URL),
+        pool_pre_ping=True,
+        **_pool_args(TimedAsyncQueuePool),
+    )
+
+if IS_SQLITE and not IS_SQLITE_MEMORY:
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Per-connection SQLite tuning (journal_mode=WAL persists in the file)."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints rather than at every commit; safe with WAL
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_KIB)}")
+        cursor.close()
+
+def get_pool_stats() -> Dict[str, Dict]:
+    """Pool occupancy and checkout waits of both engines."""
+    pools = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, _TimedPoolMixin):
+            pools[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                **pool.stats.snapshot(),
+            }
+        else:
+            pools[name] = {"pool": type(pool).__name__}
+    return pools
+
+# Statement counter of the current request (set by middleware in app.main)
+request_query_count: ContextVar[Optional[List[int]]] = ContextVar("request_query_count", default=None)
+
+@event.listens_for(engine, "before_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = request_query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+class QueryStats:
+    """Requests and SQL statements per endpoint."""
+
+    def __init__(self):
+        self._totals: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, queries: int):
+        with self._lock:
+            totals = self._totals[endpoint]
+            totals[0] += 1
+            totals[1] += queries
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                endpoint: {"requests": requests, "queries": queries, "avg_queries": round(queries / requests, 2)}
+                for endpoint, (requests, queries) in sorted(self._totals.items())
+            }
+
+query_stats = QueryStats()
 
 def create_db_and_tables():
-    """Create database tables."""
+    """Create database tables and any indexes missing from existing tables."""
     SQLModel.metadata.create_all(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session():
     """Dependency: Get database session."""
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    """Dependency: Get async database session."""
+    # Objects stay loaded after commit, so handlers can return them without a reload
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,61 @@
+"""
+Shared FastAPI dependencies for authenticated routes.
+FastAPI resolves each dependency once per request, so handlers and other
+dependencies can all depend on these without repeating token checks or
+user lookups.
+"""
+
+from uuid import UUID
+from fastapi import Depends, HTTPException, Request, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import get_async_session, settings
+from app.models import User
+from app.services.auth import get_user_id_from_token
+from app.services.cache import TTLCache
+
+# User ids recently seen in the database. Accounts are never deleted through
+# the API, so a short TTL is only a safety net for manual cleanups.
+user_exists_cache = TTLCache(maxsize=10000, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+def get_current_user_id(request: Request) -> UUID:
+    """Extract user ID from token in request scope."""
+    token = request.scope.get("token")
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    user_id = get_user_id_from_token(token)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    return user_id
+
+async def get_current_user(
+    user_id: UUID = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_async_session),
+) -> User:
+    """Load the authenticated user, 404 if the account no longer exists."""
+    user = await session.get(User, user_id)
+    if not user:
+        user_exists_cache.pop(user_id)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    if settings.USER_CACHE_TTL_SECONDS:
+        user_exists_cache.set(user_id, True)
+    return user
+
+async def get_existing_user_id(
+    user_id: UUID = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_async_session),
+) -> UUID:
+    """Authenticated user ID, verified to exist (served from cache when possible)."""
+    if settings.USER_CACHE_TTL_SECONDS and user_exists_cache.get(user_id):
+        return user_id
+    await get_current_user(user_id, session)
+    return user_id
@@ -1,11 +1,17 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi import FastAPI, Request, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlmodel import Session
 
 
-from app.database import create_db_and_tables, settings
+from app.database import create_db_and_tables, engine, async_engine, settings, query_stats, get_pool_stats
+from app.dependencies import user_exists_cache
+from app.middleware import CompressionMiddleware, ConditionalGetMiddleware, TokenScopeMiddleware
 from app.routers import auth, emissions, profile, recommendations
+from app.services.auth import token_cache, get_password_hash_stats, shutdown_hash_executor
+from app.services.factors import ensure_factor_registry, user_factor_cache
+from app.services.http_cache import get_conditional_get_stats
+from app.services.recommendations import get_recommendation_cache_stats
 
 # Create FastAPI app
 app = FastAPI(
@@ -17,49 +23,45 @@ app = FastAPI(
 # Security scheme
 security = HTTPBearer()
 
-# Add CORS middleware FIRST (important: add before routes and other middleware)
+# Middleware, innermost first: each add_middleware call wraps the ones before it.
+# ConditionalGet needs the token from TokenScope; CORS answers preflights and
+# adds its headers to every response, errors included; compression sees the
+# final body.
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(TokenScopeMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Query-Count"],
+)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.GZIP_COMPRESS_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
 )
-
-# Middleware to extract token from header and pass to routes
-@app.middleware("http")
-async def add_token_to_scope(request: Request, call_next):
-    """Extract Bearer token from Authorization header and ensure CORS headers."""
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header[7:]  # Remove "Bearer " prefix
-        request.scope["token"] = token
-    else:
-        request.scope["token"] = None
-    
-    response = await call_next(request)
-    # Always add CORS headers to responses
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    return response
-
-# Custom exception handler for HTTPException to ensure CORS headers
-@app.exception_handler(HTTPException)
-async def http_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"detail": exc.detail},
-        headers={"Access-Control-Allow-Origin": "*"}
-    )
 
 # Create tables on startup
 @app.on_event("startup")
 def on_startup():
-    """Initialize database tables on startup."""
+    """Initialize database tables and the emission factor registry on startup."""
     try:
         create_db_and_tables()
+        with Session(engine) as session:
+            ensure_factor_registry(session)
     except Exception as e:
         print(f"Error creating tables: {e}")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Stop password hashing workers and close pooled connections."""
+    shutdown_hash_executor()
+    # aiosqlite connections run on non-daemon threads that would block exit
+    await async_engine.dispose()
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(emissions.router)
@@ -81,16 +83,25 @@ def root():
         "version": "1.0.0"
     }
 
-@app.options("/{full_path:path}", include_in_schema=False)
-async def preflight_handler(full_path: str):
-    """Handle CORS preflight requests."""
-    return {}
-
 @app.get("/health")
 def health():
     """Health check endpoint."""
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """In-process cache counters, 304s, connection pools and SQL statements per endpoint."""
+    return {
+        "token_cache": token_cache.stats(),
+        "user_exists_cache": user_exists_cache.stats(),
+        "user_factor_cache": user_factor_cache.stats(),
+        "recommendation_cache": get_recommendation_cache_stats(),
+        "password_hashing": get_password_hash_stats(),
+        "queries": query_stats.snapshot(),
+        "db_pools": get_pool_stats(),
+        "conditional_get": get_conditional_get_stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
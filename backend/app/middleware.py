@@ -0,0 +1,217 @@
+"""
+Pure ASGI middleware.
+Unlike @app.middleware("http") (BaseHTTPMiddleware), these pass ASGI
+messages straight through: no extra task or memory stream per request, and
+streaming responses are neither buffered nor delayed.
+"""
+
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database import request_query_count, query_stats
+from app.services.auth import get_user_id_from_token
+from app.services.http_cache import (
+    CONDITIONAL_CACHE_CONTROL,
+    CONDITIONAL_GET_PATHS,
+    conditional_get_stats,
+    data_etag,
+    etag_matches,
+    get_data_version,
+)
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class TokenScopeMiddleware:
+    """Put the Bearer token in scope["token"] and count SQL statements per request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        auth_header = Headers(scope=scope).get("authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            scope["token"] = auth_header[7:]  # Remove "Bearer " prefix
+        else:
+            scope["token"] = None
+
+        query_count = [0]
+
+        async def send_with_query_count(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Query-Count"] = str(query_count[0])
+            await send(message)
+
+        context_token = request_query_count.set(query_count)
+        try:
+            await self.app(scope, receive, send_with_query_count)
+        finally:
+            request_query_count.reset(context_token)
+        endpoint = scope.get("endpoint")
+        if endpoint is not None:
+            query_stats.record(endpoint.__name__, query_count[0])
+
+class ConditionalGetMiddleware:
+    """
+    Tag per-user GETs with a data_version ETag and answer If-None-Match with 304.
+
+    Must run inside TokenScopeMiddleware, which provides scope["token"].
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        token = scope.get("token") if scope["type"] == "http" else None
+        if not token or scope["method"] != "GET" or scope["path"] not in CONDITIONAL_GET_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = get_user_id_from_token(token)
+        version = await get_data_version(user_id) if user_id else None
+        if version is None:
+            # Let the route report the bad token or missing account
+            await self.app(scope, receive, send)
+            return
+
+        etag = data_etag(user_id, version, scope["path"], scope["query_string"].decode("latin-1"))
+        if etag_matches(Headers(scope=scope).get("if-none-match"), etag):
+            conditional_get_stats["not_modified"] += 1
+            response = Response(status_code=304, headers={
+                "ETag": etag,
+                "Cache-Control": CONDITIONAL_CACHE_CONTROL,
+                "Vary": "Authorization",
+            })
+            await response(scope, receive, send)
+            return
+
+        async def send_with_etag(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                conditional_get_stats["etags_issued"] += 1
+                headers = MutableHeaders(scope=message)
+                headers["ETag"] = etag
+                headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+                headers.add_vary_header("Authorization")
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """Codings listed in Accept-Encoding, minus those refused with q=0."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    return accepted
+
+class _Compressor:
+    """Incremental gzip or brotli encoder; flushes each chunk so streams keep streaming."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31: gzip container
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.finish() if final else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    Compress JSON and text responses of at least minimum_size bytes.
+
+    Prefers br when the client accepts it and the brotli package is
+    installed, else gzip. Streamed bodies are always compressed, chunk by chunk.
+    Strong ETags of compressed responses are made weak.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope: Scope) -> Optional[str]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = self._choose_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message = {}
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                compressible = (
+                    "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if not compressible:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                body = compressor.compress(body, final=not more_body)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # The encoded bytes differ from what a strong ETag promises;
+                    # If-None-Match comparison (etag_matches) ignores W/
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+            else:
+                body = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, date as date_type
 from uuid import uuid4, UUID
 
 class User(SQLModel, table=True):
@@ -12,6 +13,7 @@ class User(SQLModel, table=True):
     region: str = "Global"
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    data_version: int = 0  # bumped by every write to the user's entries or profile (ETags)
     
     # Relationships
     emissions: List["EmissionEntry"] = Relationship(back_populates="user")
@@ -20,6 +22,13 @@ class User(SQLModel, table=True):
 
 class EmissionEntry(SQLModel, table=True):
     """Carbon emission log entry."""
+    __table_args__ = (
+        # Matches the history sort key so keyset pages are a single index seek
+        Index("ix_emissionentry_user_date_created_id", "user_id", "date", "created_at", "id"),
+        # Date-range aggregates (breakdown, recommendations) are index-only scans
+        Index("ix_emissionentry_user_date_totals", "user_id", "date", "category", "co2_equivalent"),
+    )
+    
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: UUID = Field(foreign_key="user.id", index=True)
     category: str  # "transport", "energy", "food"
@@ -27,7 +36,8 @@ class EmissionEntry(SQLModel, table=True):
     quantity: float
     unit: str  # "km", "kWh", "meal"
     co2_equivalent: float  # Calculated CO2 in kg
-    date: str  # YYYY-MM-DD format
+    factor_version: Optional[int] = None  # EmissionFactorVersion used for co2_equivalent
+    date: date_type
     notes: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -35,6 +45,40 @@ class EmissionEntry(SQLModel, table=True):
     user: Optional[User] = Relationship(back_populates="emissions")
 
 
+class EmissionDailyRollup(SQLModel, table=True):
+    """Per-day, per-category CO2 totals, kept in step with EmissionEntry writes."""
+    user_id: UUID = Field(foreign_key="user.id", primary_key=True)
+    day: date_type = Field(primary_key=True)
+    category: str = Field(primary_key=True)
+    co2_total: float = 0.0
+    entry_count: int = 0
+
+
+class PrecomputedRecommendation(SQLModel, table=True):
+    """A user's ranked recommendations, written by the nightly precompute job."""
+    user_id: UUID = Field(foreign_key="user.id", primary_key=True)
+    day: Optional[date_type] = None  # UTC day the 30-day window ends on
+    recommendation_ids: Optional[str] = None  # comma-separated, best first; NULL once stale
+    computed_at: Optional[datetime] = None  # when the job read the totals
+    invalidated_at: Optional[datetime] = None  # last entry write for this user
+
+
+class EmissionFactorVersion(SQLModel, table=True):
+    """A published set of emission factors. Exactly one version is active."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    description: str = ""
+    is_active: bool = Field(default=False, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EmissionFactor(SQLModel, table=True):
+    """Emission factor (kg CO2e per unit) for one subcategory in a version."""
+    version_id: int = Field(foreign_key="emissionfactorversion.id", primary_key=True)
+    category: str = Field(primary_key=True)
+    subcategory: str = Field(primary_key=True)
+    factor: float
+
+
 class UserProfile(SQLModel, table=True):
     """User preferences and profile settings."""
     id: UUID = Field(default_factory=uuid4, primary_key=True)
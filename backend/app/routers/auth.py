@@ -1,49 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlmodel import Session, select
-from app.database import get_session
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_async_session, settings
+from app.dependencies import get_current_user, user_exists_cache
 from app.models import User
 from app.schemas import RegisterRequest, LoginRequest, TokenResponse, UserResponse
-from app.services.auth import hash_password, verify_password, create_access_token
+from app.services.auth import hash_password_async, verify_password_async, create_access_token, check_hash_capacity, PasswordHasherBusy
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+def _email_taken() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Email already registered"
+    )
+
+# Async so argon2 waits in the hashing pool without holding a threadpool thread
 @router.post("/register", response_model=UserResponse)
-def register(request: RegisterRequest, session: Session = Depends(get_session)):
+async def register(request: RegisterRequest, session: AsyncSession = Depends(get_async_session)):
     """Register a new user."""
+    try:
+        check_hash_capacity()
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    
     # Check if email already exists
-    existing_user = session.exec(
+    existing_user = (await session.exec(
         select(User).where(User.email == request.email)
-    ).first()
+    )).first()
     
     if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
+        raise _email_taken()
+    
+    # Release the pooled connection while argon2 runs
+    await session.close()
+    
+    try:
+        password_hash = await hash_password_async(request.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
     
     # Create new user
     user = User(
         email=request.email,
         full_name=request.full_name,
-        password_hash=hash_password(request.password),
+        password_hash=password_hash,
         region="Global"
     )
     
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Registered by a concurrent request while this one was hashing
+        await session.rollback()
+        raise _email_taken()
     
     return user
 
 @router.post("/login", response_model=TokenResponse)
-def login(request: LoginRequest, session: Session = Depends(get_session)):
+async def login(request: LoginRequest, session: AsyncSession = Depends(get_async_session)):
     """Login user and return JWT token."""
+    try:
+        check_hash_capacity()
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    
     # Find user by email
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.email == request.email)
-    ).first()
+    )).first()
+    # Release the pooled connection while argon2 runs (user stays loaded)
+    await session.close()
+    
+    try:
+        valid = user is not None and await verify_password_async(request.password, user.password_hash)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
     
-    if not user or not verify_password(request.password, user.password_hash):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -51,6 +94,8 @@ def login(request: LoginRequest, session: Session = Depends(get_session)):
     
     # Generate JWT token
     access_token = create_access_token(user.id, user.email)
+    if settings.USER_CACHE_TTL_SECONDS:
+        user_exists_cache.set(user.id, True)
     
     return TokenResponse(
         access_token=access_token,
@@ -59,34 +104,6 @@ def login(request: LoginRequest, session: Session = Depends(get_session)):
     )
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user(
-    request: Request,
-    session: Session = Depends(get_session)
-):
+def get_me(user: User = Depends(get_current_user)):
     """Get current authenticated user profile."""
-    from app.services.auth import get_user_id_from_token
-    
-    # Get token from request scope (set by middleware)
-    token = request.scope.get("token")
-    
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated"
-        )
-    
-    user_id = get_user_id_from_token(token)
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     return user
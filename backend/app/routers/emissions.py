@@ -1,53 +1,112 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlmodel import Session, select
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
+from typing import List, Optional
+from datetime import datetime, date, timedelta, MINYEAR, MAXYEAR
 from uuid import UUID
 
-from app.database import get_session
-from app.models import EmissionEntry, User
-from app.schemas import EmissionEntryCreate, EmissionEntryResponse, EmissionEntryUpdate, EmissionBreakdownResponse, EmissionBreakdown
-from app.services.emissions import calculate_emissions
-from app.services.auth import get_user_id_from_token
+from app.database import get_session, get_async_session, settings
+from app.dependencies import get_current_user_id, get_existing_user_id
+from app.models import EmissionEntry
+from app.schemas import EmissionEntryCreate, EmissionEntryResponse, EmissionEntryUpdate, EmissionBreakdownResponse, EmissionBreakdown, EmissionBatchResponse, EmissionBatchError, EmissionImportResponse, EmissionTrendResponse, MonthlyEmissions, EmissionAnalyticsResponse
+from app.services.emissions import calculate_emissions, parse_entry_date, build_entry_rows, insert_entry_rows
+from app.services.factors import get_user_factor_set
+from app.services.importer import import_emissions, detect_format, IMPORT_FORMATS
+from app.services.rollups import RollupDeltas, apply_rollup_deltas
+from app.services.pagination import encode_cursor, decode_cursor
+from app.services.recommendations import invalidate_recommendations, invalidate_recommendations_async
+from app.services.exporter import iter_export, EXPORT_FORMATS
+from app.services.serialization import FastJSONResponse, entry_dicts
+from app.services.read_models import EntryRow, as_rows, entry_rows_query, daily_totals_query, bucket_totals_query
 
 router = APIRouter(prefix="/api/emissions", tags=["emissions"])
 
-def get_current_user_id(request: Request) -> UUID:
-    """Extract user ID from token in request scope."""
-    token = request.scope.get("token")
-    if not token:
+# Upper bound on items accepted by POST /batch
+MAX_BATCH_SIZE = 5000
+
+# Longest series served by GET /trend
+MAX_TREND_MONTHS = 60
+
+# Bucket sizes accepted by GET /analytics, and the most buckets one call may return
+ANALYTICS_GRANULARITIES = ("day", "week", "month", "year")
+MAX_ANALYTICS_BUCKETS = 1000
+
+def _shift_month(year: int, month: int, delta: int):
+    """Return (year, month) moved by delta months."""
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+def _month_range(year: int, month: int):
+    """Half-open [first day, first day of next month) range for a calendar month."""
+    start = date(year, month, 1)
+    next_year, next_month = _shift_month(year, month, 1)
+    # December 9999 has no next month; date.max is the closest end
+    end = date(next_year, next_month, 1) if next_year <= MAXYEAR else date.max
+    return start, end
+
+def _check_year_month(year: int, month: int) -> None:
+    """Raise 400 unless year/month is a representable calendar month."""
+    if year < MINYEAR or year > MAXYEAR:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Year must be between {MINYEAR} and {MAXYEAR}"
         )
-    user_id = get_user_id_from_token(token)
-    if not user_id:
+    if month < 1 or month > 12:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Month must be between 1 and 12"
         )
-    return user_id
+
+def _empty_breakdown() -> dict:
+    return {
+        "transport": 0,
+        "energy": 0,
+        "food": 0,
+        "total": 0
+    }
+
+def _bucket_start(day: date, granularity: str) -> date:
+    """First day of the bucket containing `day` (weeks start on Monday)."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+def _next_bucket(start: date, granularity: str) -> Optional[date]:
+    """First day of the following bucket, or None if it would fall after date.max."""
+    try:
+        if granularity == "week":
+            return start + timedelta(days=7)
+        if granularity == "month":
+            return date(*_shift_month(start.year, start.month, 1), 1)
+        if granularity == "year":
+            return start.replace(year=start.year + 1)
+        return start + timedelta(days=1)
+    except (OverflowError, ValueError):
+        return None
+
+def _trend(current: float, previous: float) -> float:
+    """Percent change vs the previous period (0 when there is nothing to compare)."""
+    if not previous:
+        return 0.0
+    return round((current - previous) / previous * 100, 1)
 
 @router.post("", response_model=EmissionEntryResponse)
-def create_emission(
+async def create_emission(
     emission: EmissionEntryCreate,
-    request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_existing_user_id),
 ):
     """Log a new emission entry."""
-    user_id = get_current_user_id(request)
-    
-    # Verify user exists
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     # Validate date format
     try:
-        datetime.strptime(emission.date, "%Y-%m-%d")
+        entry_date = parse_entry_date(emission.date)
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,12 +114,14 @@ def create_emission(
         )
     
     # Calculate CO2 emissions
+    factor_set = await session.run_sync(get_user_factor_set, user_id)
     try:
         co2_equivalent = calculate_emissions(
             emission.category,
             emission.subcategory,
             emission.quantity,
-            emission.unit
+            emission.unit,
+            factor_set.factors
         )
     except ValueError as e:
         raise HTTPException(
@@ -76,108 +137,358 @@ def create_emission(
         quantity=emission.quantity,
         unit=emission.unit,
         co2_equivalent=co2_equivalent,
-        date=emission.date,
+        factor_version=factor_set.version,
+        date=entry_date,
         notes=emission.notes
     )
     
     session.add(entry)
-    session.commit()
-    session.refresh(entry)
+    deltas = RollupDeltas()
+    deltas.add_entry(entry)
+    await session.run_sync(apply_rollup_deltas, deltas)
+    await session.commit()
+    await invalidate_recommendations_async(user_id)
     
     return entry
 
+@router.post("/batch", response_model=EmissionBatchResponse)
+async def create_emissions_batch(
+    emissions: List[EmissionEntryCreate],
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_existing_user_id),
+):
+    """Log many emission entries in one transaction. Invalid items are reported, not inserted."""
+    if len(emissions) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {MAX_BATCH_SIZE} entries"
+        )
+    
+    factor_set = await session.run_sync(get_user_factor_set, user_id)
+    # Scoring is CPU-bound; keep it off the event loop
+    rows, errors = await run_in_threadpool(build_entry_rows, user_id, emissions, factor_set)
+    
+    # Single INSERT + commit for the whole batch
+    await session.run_sync(insert_entry_rows, rows)
+    await session.commit()
+    if rows:
+        await invalidate_recommendations_async(user_id)
+    
+    return EmissionBatchResponse(
+        created=len(rows),
+        ids=[row["id"] for row in rows],
+        errors=[EmissionBatchError(index=index, detail=detail) for index, detail in errors]
+    )
+
+# Sync on purpose: a long CPU- and write-heavy job that belongs on a worker thread
+@router.post("/import", response_model=EmissionImportResponse)
+def import_emission_file(
+    file: UploadFile = File(...),
+    format: str = None,
+    resume_from: int = 0,
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(get_existing_user_id),
+):
+    """Stream a CSV or NDJSON export into the user's history in fixed-size chunks."""
+    fmt = (format or detect_format(file.filename) or "").lower()
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be csv or ndjson"
+        )
+    
+    try:
+        report = import_emissions(session, user_id, file.file, fmt, resume_from=max(resume_from, 0))
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be UTF-8 encoded"
+        )
+    finally:
+        # Chunks committed before a failure count too
+        invalidate_recommendations(user_id)
+    
+    return EmissionImportResponse(**report)
+
 @router.get("/history", response_model=List[EmissionEntryResponse])
-def get_history(
-    request: Request,
+async def get_history(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
     category: str = None,
-    session: Session = Depends(get_session),
+    cursor: str = None,
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
 ):
-    """Get user's emission history with optional filtering."""
-    user_id = get_current_user_id(request)
+    """
+    Get user's emission history with optional filtering.
+    
+    Newest first. Pass the X-Next-Cursor response header back as `cursor`
+    to fetch the next page; `skip` is only used when no cursor is given.
+    """
+    if limit < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Limit must be at least 1"
+        )
     
-    query = select(EmissionEntry).where(EmissionEntry.user_id == user_id)
+    query = entry_rows_query(EmissionEntry.user_id == user_id)
     
     if category:
         query = query.where(EmissionEntry.category == category.lower())
     
-    query = query.order_by(EmissionEntry.date.desc()).offset(skip).limit(limit)
-    entries = session.exec(query).all()
+    # Keyset pagination: seek past the last row of the previous page
+    if cursor:
+        key = decode_cursor(cursor)
+        if not key:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.where(
+            tuple_(EmissionEntry.date, EmissionEntry.created_at, EmissionEntry.id) < tuple_(*key)
+        )
+    elif skip:
+        query = query.offset(skip)
+    
+    # Fetch one extra row to know whether another page exists
+    query = query.order_by(
+        EmissionEntry.date.desc(),
+        EmissionEntry.created_at.desc(),
+        EmissionEntry.id.desc()
+    ).limit(limit + 1)
+    entries = as_rows(EntryRow, await session.exec(query))
     
+    if len(entries) > limit:
+        entries = entries[:limit]
+        last = entries[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.date, last.created_at, last.id)
+    
+    if settings.FAST_JSON_RESPONSES:
+        # Encode the rows directly; a returned Response does not pick up headers set on `response`
+        cursor_header = {k: v for k, v in response.headers.items() if k == "x-next-cursor"}
+        return FastJSONResponse(entry_dicts(entries), headers=cursor_header)
     return entries
 
+@router.get("/export")
+async def export_history(
+    format: str = "ndjson",
+    category: str = None,
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Stream the user's full emission history as NDJSON or CSV."""
+    fmt = format.lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be ndjson or csv"
+        )
+    
+    return StreamingResponse(
+        iter_export(user_id, fmt, category),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="emissions.{fmt}"'}
+    )
+
 @router.get("/breakdown", response_model=EmissionBreakdownResponse)
-def get_breakdown(
-    request: Request,
+async def get_breakdown(
     year: int = None,
     month: int = None,
-    session: Session = Depends(get_session),
+    include_entries: bool = True,
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
 ):
-    """Get emission breakdown for a given month."""
-    user_id = get_current_user_id(request)
-    
+    """Get emission breakdown for a given month. Set include_entries=false to skip the entry list."""
     if year is None or month is None:
         now = datetime.utcnow()
         year = year or now.year
         month = month or now.month
     
     # Build date filter
-    if month < 1 or month > 12:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Month must be between 1 and 12"
-        )
+    _check_year_month(year, month)
     
-    # Get all entries for the month
-    query = select(EmissionEntry).where(
-        (EmissionEntry.user_id == user_id) &
-        (EmissionEntry.date.like(f"{year:04d}-{month:02d}%"))
-    )
-    entries = session.exec(query).all()
+    start, end = _month_range(year, month)
+    previous_year, previous_month = _shift_month(year, month, -1)
+    # January of year 1 has no previous month to compare with
+    previous_start = _month_range(previous_year, previous_month)[0] if previous_year >= MINYEAR else start
+    
+    # Daily rollups for this and the previous month: one row per (day, category)
+    totals = await session.exec(daily_totals_query(user_id, previous_start, end))
     
     # Calculate breakdown
-    breakdown = {
-        "transport": 0,
-        "energy": 0,
-        "food": 0,
-        "total": 0
-    }
+    breakdown = _empty_breakdown()
+    previous_total = 0
+    days = set()
     
-    for entry in entries:
+    for day, category, co2 in totals:
+        if day < start:
+            if category in breakdown:
+                previous_total += co2
+            continue
+        days.add(day)
         # Only count recognized categories
-        if entry.category in breakdown:
-            breakdown[entry.category] += entry.co2_equivalent
+        if category in breakdown:
+            breakdown[category] += co2
     
     breakdown["total"] = sum([breakdown["transport"], breakdown["energy"], breakdown["food"]])
     
     # Calculate daily average
-    daily_average = breakdown["total"] / (len(set(e.date for e in entries)) or 1)
+    daily_average = breakdown["total"] / (len(days) or 1)
+    
+    entries = []
+    if include_entries:
+        entries = as_rows(EntryRow, await session.exec(
+            entry_rows_query(
+                (EmissionEntry.user_id == user_id) &
+                (EmissionEntry.date >= start) &
+                (EmissionEntry.date < end)
+            ).order_by(EmissionEntry.date)
+        ))
+    
+    summary = {
+        "total_co2_kg": round(breakdown["total"], 2),
+        "daily_average": round(daily_average, 2),
+        "trend": _trend(breakdown["total"], previous_total)
+    }
+    breakdown = EmissionBreakdown(**{k: round(v, 2) for k, v in breakdown.items()})
+    
+    if settings.FAST_JSON_RESPONSES:
+        # Same shape as EmissionBreakdownResponse
+        return FastJSONResponse({
+            "period": "month",
+            "year": year,
+            "month": month,
+            "day": None,
+            "summary": summary,
+            "breakdown": breakdown.model_dump(),
+            "entries": entry_dicts(entries)
+        })
     
     return EmissionBreakdownResponse(
         period="month",
         year=year,
         month=month,
-        summary={
-            "total_co2_kg": round(breakdown["total"], 2),
-            "daily_average": round(daily_average, 2),
-            "trend": 0.0  # TODO: calculate trend vs previous month
-        },
-        breakdown=EmissionBreakdown(**{k: round(v, 2) for k, v in breakdown.items()}),
+        summary=summary,
+        breakdown=breakdown,
         entries=[EmissionEntryResponse.from_orm(e) for e in entries]
     )
 
+@router.get("/trend", response_model=EmissionTrendResponse)
+async def get_trend(
+    months: int = 6,
+    year: int = None,
+    month: int = None,
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Get per-category totals for the `months` months ending at year/month (default: current), starting no earlier than year 1."""
+    if year is None or month is None:
+        now = datetime.utcnow()
+        year = year or now.year
+        month = month or now.month
+    
+    _check_year_month(year, month)
+    if months < 1 or months > MAX_TREND_MONTHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Months must be between 1 and {MAX_TREND_MONTHS}"
+        )
+    
+    # The series cannot start before January of year 1
+    months = min(months, (year - MINYEAR) * 12 + month)
+    first_year, first_month = _shift_month(year, month, -(months - 1))
+    start, _ = _month_range(first_year, first_month)
+    _, end = _month_range(year, month)
+    
+    # One aggregate over the whole window, grouped by calendar month
+    rows = await session.exec(bucket_totals_query(user_id, "month", start, end))
+    
+    series = {
+        _shift_month(first_year, first_month, offset): _empty_breakdown()
+        for offset in range(months)
+    }
+    for bucket_start, category, co2 in rows:
+        breakdown = series[(bucket_start.year, bucket_start.month)]
+        # Only count recognized categories
+        if category in breakdown and category != "total":
+            breakdown[category] += co2
+            breakdown["total"] += co2
+    
+    totals = [breakdown["total"] for breakdown in series.values()]
+    
+    return EmissionTrendResponse(
+        months=[
+            MonthlyEmissions(
+                year=key[0],
+                month=key[1],
+                breakdown=EmissionBreakdown(**{k: round(v, 2) for k, v in breakdown.items()})
+            )
+            for key, breakdown in series.items()
+        ],
+        trend=_trend(totals[-1], totals[-2]) if months > 1 else 0.0
+    )
+
+@router.get("/analytics", response_model=EmissionAnalyticsResponse)
+async def get_analytics(
+    start: date,
+    end: date,
+    granularity: str = "month",
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Get per-category totals for every day/week/month/year bucket from start to end (inclusive)."""
+    granularity = granularity.lower()
+    if granularity not in ANALYTICS_GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Granularity must be one of: {', '.join(ANALYTICS_GRANULARITIES)}"
+        )
+    if end < start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End date must not be before start date"
+        )
+    
+    buckets = [_bucket_start(start, granularity)]
+    next_start = _next_bucket(buckets[-1], granularity)
+    while next_start is not None and next_start <= end:
+        if len(buckets) == MAX_ANALYTICS_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range spans more than {MAX_ANALYTICS_BUCKETS} buckets; use a coarser granularity"
+            )
+        buckets.append(next_start)
+        next_start = _next_bucket(next_start, granularity)
+    
+    # One aggregate over the whole range, grouped by bucket and category. The
+    # end is exclusive; date.max has no next day, so it is clamped as in _month_range
+    query_end = end + timedelta(days=1) if end < date.max else date.max
+    rows = await session.exec(bucket_totals_query(user_id, granularity, start, query_end))
+    
+    positions = {bucket_start: index for index, bucket_start in enumerate(buckets)}
+    series = {category: [0.0] * len(buckets) for category in _empty_breakdown()}
+    for bucket_start, category, co2 in rows:
+        # Only count recognized categories
+        if category in series and category != "total":
+            index = positions[bucket_start]
+            series[category][index] += co2
+            series["total"][index] += co2
+    
+    return EmissionAnalyticsResponse(
+        granularity=granularity,
+        buckets=buckets,
+        **{category: [round(value, 2) for value in values] for category, values in series.items()}
+    )
+
 @router.put("/{entry_id}", response_model=EmissionEntryResponse)
-def update_emission(
+async def update_emission(
     entry_id: str,
     emission: EmissionEntryUpdate,
-    request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
 ):
     """Update an emission entry."""
-    user_id = get_current_user_id(request)
-    
-    entry = session.get(EmissionEntry, UUID(entry_id))
+    entry = await session.get(EmissionEntry, UUID(entry_id))
     if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -190,6 +501,10 @@ def update_emission(
             detail="Not authorized to update this entry"
         )
     
+    # Move the entry's old contribution out of its rollup
+    deltas = RollupDeltas()
+    deltas.add_entry(entry, -1)
+    
     # Update fields
     if emission.category:
         entry.category = emission.category
@@ -200,19 +515,28 @@ def update_emission(
     if emission.unit:
         entry.unit = emission.unit
     if emission.date:
-        entry.date = emission.date
+        try:
+            entry.date = parse_entry_date(emission.date)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid date format. Use YYYY-MM-DD"
+            )
     if emission.notes is not None:
         entry.notes = emission.notes
     
     # Recalculate CO2 if needed
     if emission.quantity or emission.subcategory or emission.category:
+        factor_set = await session.run_sync(get_user_factor_set, user_id)
         try:
             entry.co2_equivalent = calculate_emissions(
                 entry.category,
                 entry.subcategory,
                 entry.quantity,
-                entry.unit
+                entry.unit,
+                factor_set.factors
             )
+            entry.factor_version = factor_set.version
         except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -220,21 +544,21 @@ def update_emission(
             )
     
     session.add(entry)
-    session.commit()
-    session.refresh(entry)
+    deltas.add_entry(entry)
+    await session.run_sync(apply_rollup_deltas, deltas)
+    await session.commit()
+    await invalidate_recommendations_async(user_id)
     
     return entry
 
 @router.delete("/{entry_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_emission(
+async def delete_emission(
     entry_id: str,
-    request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_current_user_id),
 ):
     """Delete an emission entry."""
-    user_id = get_current_user_id(request)
-    
-    entry = session.get(EmissionEntry, UUID(entry_id))
+    entry = await session.get(EmissionEntry, UUID(entry_id))
     if not entry:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -247,6 +571,10 @@ def delete_emission(
             detail="Not authorized to delete this entry"
         )
     
-    session.delete(entry)
-    session.commit()
+    await session.delete(entry)
+    deltas = RollupDeltas()
+    deltas.add_entry(entry, -1)
+    await session.run_sync(apply_rollup_deltas, deltas)
+    await session.commit()
+    await invalidate_recommendations_async(user_id)
     return None
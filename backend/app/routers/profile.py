@@ -1,56 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlmodel import Session, select
-from uuid import UUID
+from fastapi import APIRouter, Depends
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 
-from app.database import get_session
+from app.database import get_async_session
+from app.dependencies import get_current_user
 from app.models import User, UserProfile
 from app.schemas import UserProfileUpdate, UserProfileResponse, UserResponse
-from app.services.auth import get_user_id_from_token
+from app.services.factors import invalidate_user_factors
+from app.services.http_cache import bump_data_versions
 
 router = APIRouter(prefix="/api/profile", tags=["profile"])
 
-def get_current_user_id(request: Request) -> UUID:
-    """Extract user ID from token in request scope."""
-    token = request.scope.get("token")
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated"
-        )
-    user_id = get_user_id_from_token(token)
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    return user_id
-
 @router.get("", response_model=UserProfileResponse)
-def get_profile(
-    request: Request,
-    session: Session = Depends(get_session),
+async def get_profile(
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
 ):
     """Get user profile with settings."""
-    user_id = get_current_user_id(request)
-    
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+    user_id = user.id
     
     # Get or create profile
-    profile = session.exec(
+    profile = (await session.exec(
         select(UserProfile).where(UserProfile.user_id == user_id)
-    ).first()
+    )).first()
     
     if not profile:
         profile = UserProfile(user_id=user_id)
         session.add(profile)
-        session.commit()
-        session.refresh(profile)
+        await session.commit()
     
     return UserProfileResponse(
         user=UserResponse.from_orm(user),
@@ -60,30 +38,25 @@ def get_profile(
     )
 
 @router.put("", response_model=UserProfileResponse)
-def update_profile(
+async def update_profile(
     profile_update: UserProfileUpdate,
-    request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
 ):
     """Update user profile and settings."""
-    user_id = get_current_user_id(request)
-    
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+    user_id = user.id
     
     # Get or create profile
-    profile = session.exec(
+    profile = (await session.exec(
         select(UserProfile).where(UserProfile.user_id == user_id)
-    ).first()
+    )).first()
     
     if not profile:
         profile = UserProfile(user_id=user_id)
         session.add(profile)
     
+    factors_before = (user.region, profile.energy_source)
+    
     # Update user fields
     if profile_update.full_name:
         user.full_name = profile_update.full_name
@@ -103,9 +76,12 @@ def update_profile(
     
     session.add(user)
     session.add(profile)
-    session.commit()
-    session.refresh(user)
-    session.refresh(profile)
+    await session.run_sync(bump_data_versions, [user_id])
+    await session.commit()
+    
+    # New entries must use the new regional factors
+    if (user.region, profile.energy_source) != factors_before:
+        invalidate_user_factors(user_id)
     
     return UserProfileResponse(
         user=UserResponse.from_orm(user),
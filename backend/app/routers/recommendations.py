@@ -1,64 +1,87 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Dict, Mapping, Tuple
 from uuid import UUID
+import hashlib
 
-from app.database import get_session
-from app.models import User
-from app.schemas import RecommendationsResponse, RecommendationItem
-from app.services.recommendations import get_recommendations
-from app.services.auth import get_user_id_from_token
+from app.database import get_async_session
+from app.dependencies import get_existing_user_id
+from app.schemas import RecommendationsResponse, RecommendationItem, RecommendationCatalogResponse
+from app.services.http_cache import etag_matches
+from app.services.recommendations import (
+    CATALOG_INDEX,
+    DIFFICULTIES,
+    RECOMMENDATION_CATEGORIES,
+    get_catalog,
+    get_recommendations_async,
+)
 
 router = APIRouter(prefix="/api/recommendations", tags=["recommendations"])
 
-def get_current_user_id(request: Request) -> UUID:
-    """Extract user ID from token in request scope."""
-    token = request.scope.get("token")
-    if not token:
+# The catalog only changes with a deploy; the ETag lets clients revalidate after max-age
+CATALOG_CACHE_CONTROL = "public, max-age=3600"
+
+def _to_item(rec: Mapping) -> RecommendationItem:
+    return RecommendationItem(
+        id=rec["id"],
+        category=rec["category"],
+        action=rec["action"],
+        description=rec["description"],
+        potential_savings=rec["savings"],
+        priority=rec["priority"],
+        difficulty=rec["difficulty"]
+    )
+
+def _build_catalog_bodies() -> Dict[Tuple, Tuple[bytes, str]]:
+    """Serialized body and strong ETag for every catalog filter, built once at import."""
+    bodies = {}
+    for category, difficulty in CATALOG_INDEX:
+        body = RecommendationCatalogResponse(
+            recommendations=[_to_item(rec) for rec in get_catalog(category, difficulty)]
+        ).model_dump_json().encode()
+        bodies[(category, difficulty)] = (body, '"%s"' % hashlib.sha256(body).hexdigest()[:32])
+    return bodies
+
+_CATALOG_BODIES = _build_catalog_bodies()
+
+@router.get("/catalog", response_model=RecommendationCatalogResponse)
+async def get_recommendation_catalog(
+    request: Request,
+    category: str = None,
+    difficulty: str = None,
+):
+    """Every recommendation, largest savings first. Public and cacheable."""
+    category = category.lower() if category else None
+    difficulty = difficulty.lower() if difficulty else None
+    if category is not None and category not in RECOMMENDATION_CATEGORIES:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Category must be one of: {', '.join(RECOMMENDATION_CATEGORIES)}"
         )
-    user_id = get_user_id_from_token(token)
-    if not user_id:
+    if difficulty is not None and difficulty not in DIFFICULTIES:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Difficulty must be one of: {', '.join(DIFFICULTIES)}"
         )
-    return user_id
+    
+    body, etag = _CATALOG_BODIES[(category, difficulty)]
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("", response_model=RecommendationsResponse)
-def get_user_recommendations(
-    request: Request,
+async def get_user_recommendations(
     limit: int = 5,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(get_existing_user_id),
 ):
     """Get personalized recommendations for reducing carbon footprint."""
-    user_id = get_current_user_id(request)
-    
-    # Verify user exists
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     # Get recommendations
-    recommendations, total_savings = get_recommendations(session, user_id, limit)
+    recommendations, total_savings = await get_recommendations_async(session, user_id, limit)
     
     # Convert to response schema
-    rec_items = [
-        RecommendationItem(
-            id=rec["id"],
-            category=rec["category"],
-            action=rec["action"],
-            description=rec["description"],
-            potential_savings=rec["savings"],
-            priority=rec["priority"],
-            difficulty=rec["difficulty"]
-        )
-        for rec in recommendations
-    ]
+    rec_items = [_to_item(rec) for rec in recommendations]
     
     return RecommendationsResponse(
         recommendations=rec_items,
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, date as date_type
 from uuid import UUID
 
 # ==================== AUTH SCHEMAS ====================
@@ -63,10 +63,29 @@ class EmissionEntryResponse(BaseModel):
     quantity: float
     unit: str
     co2_equivalent: float
-    date: str
+    date: date_type
     notes: Optional[str]
     created_at: datetime
 
+class EmissionBatchError(BaseModel):
+    """Error for a single item of a batch upload."""
+    index: int
+    detail: str
+
+class EmissionBatchResponse(BaseModel):
+    """Batch emission upload result."""
+    created: int
+    ids: List[UUID]
+    errors: List[EmissionBatchError]
+
+class EmissionImportResponse(BaseModel):
+    """Bulk import result. Pass records_committed as resume_from to continue an interrupted import."""
+    records_committed: int
+    created: int
+    failed: int
+    chunks_committed: int
+    errors: List[EmissionBatchError]
+
 # ==================== PROFILE SCHEMAS ====================
 
 class UserProfileUpdate(BaseModel):
@@ -103,6 +122,26 @@ class EmissionBreakdownResponse(BaseModel):
     breakdown: EmissionBreakdown
     entries: List[EmissionEntryResponse]
 
+class MonthlyEmissions(BaseModel):
+    """Emission totals for one calendar month."""
+    year: int
+    month: int
+    breakdown: EmissionBreakdown
+
+class EmissionTrendResponse(BaseModel):
+    """Trailing monthly totals, oldest month first."""
+    months: List[MonthlyEmissions]
+    trend: float  # % change of the last month vs the one before
+
+class EmissionAnalyticsResponse(BaseModel):
+    """Per-bucket totals as parallel arrays: index i of every series is buckets[i]."""
+    granularity: str  # "day", "week", "month" or "year"
+    buckets: List[date_type]  # first day of each bucket, oldest first
+    transport: List[float]
+    energy: List[float]
+    food: List[float]
+    total: List[float]
+
 class RecommendationItem(BaseModel):
     """Single recommendation."""
     id: str
@@ -117,3 +156,7 @@ class RecommendationsResponse(BaseModel):
     """Personalized recommendations response."""
     recommendations: List[RecommendationItem]
     total_potential_savings: float
+
+class RecommendationCatalogResponse(BaseModel):
+    """Every available recommendation, largest savings first."""
+    recommendations: List[RecommendationItem]
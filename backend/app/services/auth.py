@@ -1,11 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import asyncio
+import multiprocessing
+import os
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.database import settings
+from app.services.cache import TTLCache
 from uuid import UUID
 
 # Password hashing context - use argon2id instead of bcrypt to avoid 72-byte limit
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+# Argon2 runs in dedicated worker processes so login storms neither hold
+# the GIL nor tie up the threadpool that serves sync endpoints
+_hash_executor = None
+_hash_pending = 0
+password_hash_stats = {"completed": 0, "rejected": 0}
+
+# Verified token -> user id. Entries expire with the token, so a cached hit
+# is never valid longer than the signature check would have allowed.
+token_cache = TTLCache(maxsize=max(settings.TOKEN_CACHE_SIZE, 1))
 
 def hash_password(password: str) -> str:
     """Hash a password using argon2."""
@@ -15,6 +40,64 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return pwd_context.verify(plain_password, hashed_password)
 
+def _lower_priority():
+    """Worker initializer: let request handling win the CPU over hashing."""
+    os.nice(5)
+
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            # spawn: forking a process that runs threads can copy held locks
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_lower_priority,
+        )
+    return _hash_executor
+
+def shutdown_hash_executor():
+    """Stop the hashing workers (app shutdown)."""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True, cancel_futures=True)
+        _hash_executor = None
+
+def check_hash_capacity():
+    """Raise PasswordHasherBusy if the hashing queue is full (call before other work)."""
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        password_hash_stats["rejected"] += 1
+        raise PasswordHasherBusy()
+
+async def _run_hash(func, *args):
+    """Run func in the hashing pool, rejecting work beyond PASSWORD_HASH_MAX_PENDING."""
+    global _hash_pending
+    check_hash_capacity()
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_get_hash_executor(), func, *args)
+    finally:
+        _hash_pending -= 1
+    password_hash_stats["completed"] += 1
+    return result
+
+async def hash_password_async(password: str) -> str:
+    """hash_password in the hashing pool. Raises PasswordHasherBusy when saturated."""
+    return await _run_hash(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password in the hashing pool. Raises PasswordHasherBusy when saturated."""
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
+def get_password_hash_stats() -> dict:
+    """Counters for monitoring."""
+    return {
+        **password_hash_stats,
+        "pending": _hash_pending,
+        "max_pending": settings.PASSWORD_HASH_MAX_PENDING,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+    }
+
 def create_access_token(user_id: UUID, email: str) -> str:
     """Create JWT access token."""
     expire = datetime.utcnow() + timedelta(hours=settings.JWT_EXPIRATION_HOURS)
@@ -43,8 +126,19 @@ def decode_token(token: str) -> dict:
         return None
 
 def get_user_id_from_token(token: str) -> UUID:
-    """Extract user ID from token."""
+    """Extract user ID from token, skipping verification for recently verified tokens."""
+    if settings.TOKEN_CACHE_SIZE:
+        user_id = token_cache.get(token)
+        if user_id is not None:
+            return user_id
+    
     payload = decode_token(token)
-    if payload:
-        return UUID(payload.get("sub"))
-    return None
+    if not payload:
+        return None
+    user_id = UUID(payload.get("sub"))
+    
+    # Only valid tokens are cached; tokens without exp are always re-verified
+    ttl = payload.get("exp", 0) - time.time()
+    if settings.TOKEN_CACHE_SIZE and ttl > 0:
+        token_cache.set(token, user_id, ttl=ttl)
+    return user_id
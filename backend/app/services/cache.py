@@ -0,0 +1,168 @@
+"""
+Small caches.
+TTLCache is a thread-safe in-process LRU with per-entry expiry and hit/miss
+counters, used for hot lookups that are cheap to rebuild but too frequent to
+query. SQLiteCache has the same interface but lives in a SQLite file, so
+every worker process on a host shares it.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; ttl overrides the cache default for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, returning its value if present."""
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+class SQLiteCache:
+    """
+    TTL cache stored in a SQLite file and shared by all worker processes.
+    
+    A local stand-in for a networked cache (Redis, memcached) with the same
+    get/set/pop interface as TTLCache. Values must be JSON-serializable;
+    hit/miss counters are per process.
+    """
+
+    # Expired and surplus rows are pruned every PRUNE_INTERVAL sets
+    PRUNE_INTERVAL = 256
+
+    def __init__(self, path: str, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (str(key),)
+            ).fetchone()
+            # Wall clock rather than monotonic: expiry is compared across processes
+            if row is not None and (row[1] is None or row[1] > time.time()):
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; ttl overrides the cache default for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (str(key), json.dumps(value), expires_at),
+            )
+            self._sets += 1
+            if self._sets % self.PRUNE_INTERVAL == 0:
+                self._prune()
+
+    def _prune(self):
+        """Drop expired rows, then the soonest-expiring ones beyond maxsize."""
+        removed = self._conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        ).rowcount
+        removed += self._conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY expires_at IS NULL, expires_at "
+            "LIMIT max((SELECT count(*) FROM cache) - ?, 0))",
+            (self.maxsize,),
+        ).rowcount
+        self.evictions += removed
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, returning its value if present."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (str(key),)).fetchone()
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (str(key),))
+        return default if row is None else json.loads(row[0])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+            "maxsize": self.maxsize,
+        }
@@ -1,8 +1,21 @@
 """
 Carbon emission calculation service with standard emission factors.
-All factors are global averages in kg CO2 equivalent.
+EMISSION_FACTORS are global averages in kg CO2 equivalent; REGION_FACTORS
+and the household energy source adjust them per user.
+
+EMISSION_FACTORS is the built-in table; it seeds version 1 of the factor
+registry (app/services/factors.py), which supplies the active table at runtime.
 """
 
+from typing import List, Dict, Tuple, Iterable, Sequence, NamedTuple, Optional
+from datetime import datetime, date
+from uuid import UUID, uuid4
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session
+from app.models import EmissionEntry
+from app.services.rollups import RollupDeltas, apply_rollup_deltas
+
 # Emission factors (kg CO2e per unit)
 EMISSION_FACTORS = {
     "transport": {
@@ -28,11 +41,107 @@ EMISSION_FACTORS = {
     }
 }
 
+# Regional overrides of the global factors (kg CO2e per unit). Electricity is
+# the grid intensity of the region; electric cars use about 0.2 kWh per km.
+GLOBAL_REGION = "global"
+
+REGION_FACTORS = {
+    "north america": {
+        "energy": {"electricity": 0.350},
+        "transport": {"electric_car": 0.070},
+    },
+    "europe": {
+        "energy": {"electricity": 0.250},
+        "transport": {"electric_car": 0.050},
+    },
+    "asia": {
+        "energy": {"electricity": 0.550},
+        "transport": {"electric_car": 0.110},
+    },
+    "south america": {
+        "energy": {"electricity": 0.190},
+        "transport": {"electric_car": 0.038},
+    },
+    "africa": {
+        "energy": {"electricity": 0.470},
+        "transport": {"electric_car": 0.094},
+    },
+    "oceania": {
+        "energy": {"electricity": 0.500},
+        "transport": {"electric_car": 0.100},
+    },
+}
+
+# Lifecycle intensity of renewable electricity (kg CO2e per kWh)
+RENEWABLE_ELECTRICITY_FACTOR = 0.024
+
+# Share of household electricity covered by renewables, per UserProfile.energy_source
+ENERGY_SOURCE_RENEWABLE_SHARE = {
+    "grid": 0.0,
+    "mixed": 0.5,
+    "renewable": 1.0,
+}
+
+def normalize_region(region: Optional[str]) -> str:
+    """Map a User.region value to a REGION_FACTORS key, falling back to global."""
+    key = (region or "").strip().lower()
+    return key if key in REGION_FACTORS else GLOBAL_REGION
+
+def compile_region_lookup(
+    factors: Dict[str, Dict[str, float]]
+) -> Dict[Tuple[str, str, str], float]:
+    """
+    Flatten a factor table and REGION_FACTORS into one lookup.
+    
+    Args:
+        factors: base {category: {subcategory: factor}} table
+    
+    Returns:
+        {(region, category, subcategory): factor} for every region, including
+        GLOBAL_REGION. Only subcategories of the base table are included.
+    """
+    lookup = {}
+    for region, overrides in [(GLOBAL_REGION, {})] + list(REGION_FACTORS.items()):
+        for category, subcategories in factors.items():
+            category_overrides = overrides.get(category, {})
+            for subcategory, factor in subcategories.items():
+                lookup[(region, category, subcategory)] = category_overrides.get(subcategory, factor)
+    return lookup
+
+def resolve_factors(
+    lookup: Dict[Tuple[str, str, str], float],
+    region: Optional[str],
+    energy_source: Optional[str] = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Build the {category: {subcategory: factor}} table for one region and energy source.
+    
+    Args:
+        lookup: table from compile_region_lookup
+        region: User.region (unknown regions use global factors)
+        energy_source: UserProfile.energy_source ("grid", "mixed" or "renewable")
+    
+    Returns:
+        Factor table usable with calculate_emissions and compile_factor_table
+    """
+    region = normalize_region(region)
+    factors: Dict[str, Dict[str, float]] = {}
+    for (lookup_region, category, subcategory), factor in lookup.items():
+        if lookup_region == region:
+            factors.setdefault(category, {})[subcategory] = factor
+    
+    share = ENERGY_SOURCE_RENEWABLE_SHARE.get((energy_source or "grid").lower(), 0.0)
+    if share and "electricity" in factors.get("energy", {}):
+        grid = factors["energy"]["electricity"]
+        factors["energy"]["electricity"] = grid * (1 - share) + RENEWABLE_ELECTRICITY_FACTOR * share
+    return factors
+
 def calculate_emissions(
     category: str,
     subcategory: str,
     quantity: float,
-    unit: str = None
+    unit: str = None,
+    factors: Dict[str, Dict[str, float]] = None
 ) -> float:
     """
     Calculate CO2 emissions for a given activity.
@@ -42,27 +151,204 @@ def calculate_emissions(
         subcategory: specific activity type
         quantity: amount of activity
         unit: optional unit (auto-detected from category if not provided)
+        factors: factor table to use (defaults to EMISSION_FACTORS)
     
     Returns:
         CO2 equivalent in kg
     """
+    factors = factors or EMISSION_FACTORS
     category_lower = category.lower()
     subcategory_lower = subcategory.lower()
     
-    if category_lower not in EMISSION_FACTORS:
+    if category_lower not in factors:
         raise ValueError(f"Unknown category: {category}")
     
-    if subcategory_lower not in EMISSION_FACTORS[category_lower]:
+    if subcategory_lower not in factors[category_lower]:
         raise ValueError(f"Unknown subcategory: {subcategory} for {category}")
     
     # Get emission factor
-    factor = EMISSION_FACTORS[category_lower][subcategory_lower]
+    factor = factors[category_lower][subcategory_lower]
     
     # Calculate CO2
     co2 = factor * quantity
     
     return round(co2, 2)
 
+def compile_factor_table(factors: Dict[str, Dict[str, float]]) -> Dict:
+    """
+    Flatten a nested factor table for vectorized lookups.
+    
+    Returns a dict with integer codes for lowercased category and subcategory
+    names and a (categories x subcategories) factor matrix, NaN where the pair
+    does not exist.
+    """
+    category_codes = {name: code for code, name in enumerate(factors)}
+    subcategory_codes = {}
+    for subfactors in factors.values():
+        for name in subfactors:
+            subcategory_codes.setdefault(name, len(subcategory_codes))
+    
+    matrix = np.full((len(category_codes), len(subcategory_codes)), np.nan)
+    for category, subfactors in factors.items():
+        for subcategory, factor in subfactors.items():
+            matrix[category_codes[category], subcategory_codes[subcategory]] = factor
+    
+    return {
+        "category_codes": category_codes,
+        "subcategory_codes": subcategory_codes,
+        "matrix": matrix,
+    }
+
+COMPILED_FACTORS = compile_factor_table(EMISSION_FACTORS)
+
+class FactorSet(NamedTuple):
+    """A factor table with its registry version and compiled form."""
+    version: Optional[int]
+    factors: Dict[str, Dict[str, float]]
+    compiled: Dict
+
+# Used when no registry version is available (version None)
+DEFAULT_FACTOR_SET = FactorSet(None, EMISSION_FACTORS, COMPILED_FACTORS)
+
+def _encode(values: Sequence[str], codes: Dict[str, int]) -> np.ndarray:
+    """Map strings to codes (case-insensitive), -1 if unknown. Each distinct value is looked up once."""
+    if isinstance(values, np.ndarray):
+        uniques, inverse = np.unique(values, return_inverse=True)
+        lookup = np.array([codes.get(str(value).lower(), -1) for value in uniques.tolist()], dtype=np.int64)
+        return lookup[inverse.reshape(-1)]
+    lookup = {value: codes.get(value.lower(), -1) for value in set(values)}
+    return np.fromiter(map(lookup.__getitem__, values), dtype=np.int64, count=len(values))
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """
+    Round to 2 decimals exactly like the builtin round().
+    
+    rint(x * 100) / 100 agrees with round(x, 2) except where x * 100 lands
+    within float error of a .5 tie; those few values go through round().
+    """
+    scaled = values * 100
+    rounded = np.rint(scaled) / 100
+    distance = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5)
+    near_tie = np.flatnonzero(distance <= np.abs(scaled) * 1e-15 + 1e-12)
+    for i in near_tie.tolist():
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+def calculate_emissions_batch(
+    categories: Sequence[str],
+    subcategories: Sequence[str],
+    quantities: Sequence[float],
+    compiled: Dict = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized calculate_emissions over parallel arrays.
+    
+    Args:
+        categories: category per row
+        subcategories: subcategory per row
+        quantities: amount per row
+        compiled: table from compile_factor_table (defaults to EMISSION_FACTORS)
+    
+    Returns:
+        Tuple of (CO2 kg per row, error flag per row). Results match
+        calculate_emissions exactly; rows flagged as errors have CO2 0.0.
+    """
+    compiled = compiled or COMPILED_FACTORS
+    quantities = np.asarray(quantities, dtype=np.float64)
+    if not len(quantities):
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    
+    category_idx = _encode(categories, compiled["category_codes"])
+    subcategory_idx = _encode(subcategories, compiled["subcategory_codes"])
+    
+    known = (category_idx >= 0) & (subcategory_idx >= 0)
+    factors = compiled["matrix"][np.where(known, category_idx, 0), np.where(known, subcategory_idx, 0)]
+    errors = ~known | np.isnan(factors)
+    
+    co2 = _round2(np.where(errors, 0.0, factors) * quantities)
+    return co2, errors
+
+def parse_entry_date(value: str) -> date:
+    """Parse a YYYY-MM-DD entry date. Raises ValueError if malformed."""
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def build_entry_rows(
+    user_id: UUID,
+    emissions: Iterable,
+    factor_set: FactorSet = DEFAULT_FACTOR_SET
+) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """
+    Validate and score a batch of EmissionEntryCreate items.
+    
+    Args:
+        user_id: Owner of the entries
+        emissions: EmissionEntryCreate items
+        factor_set: Factors to score with (see app.services.factors)
+    
+    Returns:
+        Tuple of (insertable row dicts, list of (index, error detail))
+    """
+    rows = []
+    errors = []
+    now = datetime.utcnow()
+    
+    # Dates repeat heavily in bulk uploads, parse each distinct string once
+    parsed_dates = {}
+    valid = []
+    for index, emission in enumerate(emissions):
+        if emission.date not in parsed_dates:
+            try:
+                parsed_dates[emission.date] = parse_entry_date(emission.date)
+            except ValueError:
+                parsed_dates[emission.date] = None
+        if parsed_dates[emission.date] is None:
+            errors.append((index, "Invalid date format. Use YYYY-MM-DD"))
+            continue
+        valid.append((index, emission))
+    
+    co2, failed = calculate_emissions_batch(
+        [emission.category for _, emission in valid],
+        [emission.subcategory for _, emission in valid],
+        [emission.quantity for _, emission in valid],
+        factor_set.compiled
+    )
+    
+    for (index, emission), co2_equivalent, is_error in zip(valid, co2.tolist(), failed.tolist()):
+        if is_error:
+            try:
+                # Re-run the scalar path for its error message
+                calculate_emissions(
+                    emission.category, emission.subcategory, emission.quantity, emission.unit, factor_set.factors
+                )
+            except ValueError as e:
+                errors.append((index, str(e)))
+            continue
+        
+        rows.append({
+            "id": uuid4(),
+            "user_id": user_id,
+            "category": emission.category,
+            "subcategory": emission.subcategory,
+            "quantity": emission.quantity,
+            "unit": emission.unit,
+            "co2_equivalent": co2_equivalent,
+            "factor_version": factor_set.version,
+            "date": parsed_dates[emission.date],
+            "notes": emission.notes,
+            "created_at": now,
+        })
+    
+    errors.sort()
+    return rows, errors
+
+def insert_entry_rows(session: Session, rows: List[Dict]) -> None:
+    """Write prepared entry rows and their rollups with executemany INSERTs (caller commits)."""
+    if rows:
+        session.execute(insert(EmissionEntry), rows)
+        deltas = RollupDeltas()
+        deltas.add_rows(rows)
+        apply_rollup_deltas(session, deltas)
+
 def get_available_subcategories(category: str) -> list:
     """Get list of available subcategories for a category."""
     category_lower = category.lower()
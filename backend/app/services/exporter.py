@@ -0,0 +1,74 @@
+"""
+Streaming export of a user's emission history.
+Rows are pulled through a server-side cursor in fixed-size batches and
+encoded as they arrive, so memory stays constant for any history size.
+"""
+
+import csv
+import io
+import json
+from typing import Iterator, Optional
+from uuid import UUID
+from sqlmodel import Session
+
+from app.database import engine
+from app.models import EmissionEntry
+from app.services.read_models import EntryRow, entry_rows_query
+
+# Rows fetched per cursor round trip and emitted per response chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = EntryRow._fields
+
+def _encode_row(row) -> dict:
+    """Convert a result row to the EmissionEntryResponse wire format."""
+    return {
+        "id": str(row.id),
+        "user_id": str(row.user_id),
+        "category": row.category,
+        "subcategory": row.subcategory,
+        "quantity": row.quantity,
+        "unit": row.unit,
+        "co2_equivalent": row.co2_equivalent,
+        "date": row.date.isoformat(),
+        "notes": row.notes,
+        "created_at": row.created_at.isoformat(),
+    }
+
+def iter_export(user_id: UUID, fmt: str, category: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield encoded export chunks for a user's history, oldest first.
+
+    Opens its own session because the generator outlives the request handler.
+    """
+    query = entry_rows_query(EmissionEntry.user_id == user_id)
+    if category:
+        query = query.where(EmissionEntry.category == category.lower())
+    query = query.order_by(EmissionEntry.date, EmissionEntry.created_at).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+        # Send the header right away so the client sees the first byte immediately
+        yield buffer.getvalue()
+
+    with Session(engine) as session:
+        for partition in session.execute(query).partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            for row in partition:
+                record = _encode_row(row)
+                if fmt == "csv":
+                    writer.writerow(record[column] for column in EXPORT_COLUMNS)
+                else:
+                    buffer.write(json.dumps(record))
+                    buffer.write("\n")
+            yield buffer.getvalue()
@@ -0,0 +1,354 @@
+"""
+Versioned emission-factor registry.
+Factor tables live in the database as numbered versions, one of them active.
+The active set is cached in process and re-validated every
+FACTOR_CACHE_TTL_SECONDS, so publishing a version in one worker reaches the
+others without a restart. Entries record the version they were scored with,
+and recalculate_entries brings stored values up to the active version.
+
+Each user is scored with the active set adjusted for their region and energy
+source (see resolve_factors). Resolved sets are cached per user and shared
+between users with the same (version, region, energy source).
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import bindparam, or_, update
+from sqlmodel import Session, select
+
+from app.models import EmissionEntry, EmissionFactor, EmissionFactorVersion, User, UserProfile
+from app.services.cache import TTLCache
+from app.services.emissions import (
+    EMISSION_FACTORS,
+    DEFAULT_FACTOR_SET,
+    ENERGY_SOURCE_RENEWABLE_SHARE,
+    FactorSet,
+    calculate_emissions_batch,
+    compile_factor_table,
+    compile_region_lookup,
+    normalize_region,
+    resolve_factors,
+)
+from app.services.recommendations import invalidate_recommendations
+from app.services.rollups import RollupDeltas, apply_rollup_deltas
+
+# How long a worker trusts its cached active version before re-checking
+FACTOR_CACHE_TTL_SECONDS = 60
+
+# Entries rewritten per transaction by recalculate_entries
+RECALC_CHUNK_SIZE = 1000
+
+# Profile edits invalidate a user's entry directly; the TTL bounds staleness
+# for edits handled by another worker
+USER_FACTOR_CACHE_TTL_SECONDS = 300
+USER_FACTOR_CACHE_SIZE = 10000
+
+_cache_lock = threading.Lock()
+_cached_set: Optional[FactorSet] = None
+_cached_at = 0.0
+
+user_factor_cache = TTLCache(maxsize=USER_FACTOR_CACHE_SIZE, ttl=USER_FACTOR_CACHE_TTL_SECONDS)
+_region_lookups = TTLCache(maxsize=8)
+_resolved_sets = TTLCache(maxsize=256)
+
+def _active_version_id(session: Session) -> Optional[int]:
+    return session.exec(
+        select(EmissionFactorVersion.id).where(EmissionFactorVersion.is_active == True)
+    ).first()
+
+def load_factor_set(session: Session, version_id: int) -> FactorSet:
+    """Load one registry version as a FactorSet."""
+    factors: Dict[str, Dict[str, float]] = {}
+    for row in session.exec(select(EmissionFactor).where(EmissionFactor.version_id == version_id)):
+        factors.setdefault(row.category, {})[row.subcategory] = row.factor
+    return FactorSet(version_id, factors, compile_factor_table(factors))
+
+def invalidate_factor_cache():
+    """Drop the cached active set; the next lookup reloads it."""
+    global _cached_set, _cached_at
+    with _cache_lock:
+        _cached_set = None
+        _cached_at = 0.0
+
+def get_active_factor_set(session: Session) -> FactorSet:
+    """
+    Return the active factor set, served from the in-process cache.
+
+    Falls back to the built-in EMISSION_FACTORS when the registry is empty.
+    """
+    global _cached_set, _cached_at
+    now = time.monotonic()
+    cached = _cached_set
+    if cached is not None and now - _cached_at < FACTOR_CACHE_TTL_SECONDS:
+        return cached
+
+    version_id = _active_version_id(session)
+    if version_id is None:
+        factor_set = DEFAULT_FACTOR_SET
+    elif cached is not None and cached.version == version_id:
+        # Still current, only the TTL expired
+        factor_set = cached
+    else:
+        factor_set = load_factor_set(session, version_id)
+
+    with _cache_lock:
+        _cached_set = factor_set
+        _cached_at = now
+    return factor_set
+
+def _normalize_energy_source(energy_source: Optional[str]) -> str:
+    source = (energy_source or "grid").lower()
+    return source if source in ENERGY_SOURCE_RENEWABLE_SHARE else "grid"
+
+def resolve_factor_set(base: FactorSet, region: Optional[str], energy_source: Optional[str]) -> FactorSet:
+    """Adjust a factor set for a region and energy source (memoized per version)."""
+    key = (base.version, normalize_region(region), _normalize_energy_source(energy_source))
+    resolved = _resolved_sets.get(key)
+    if resolved is None:
+        lookup = _region_lookups.get(base.version)
+        if lookup is None:
+            lookup = compile_region_lookup(base.factors)
+            _region_lookups.set(base.version, lookup)
+        factors = resolve_factors(lookup, key[1], key[2])
+        resolved = FactorSet(base.version, factors, compile_factor_table(factors))
+        _resolved_sets.set(key, resolved)
+    return resolved
+
+def get_user_factor_set(session: Session, user_id: UUID) -> FactorSet:
+    """
+    Return the active factor set resolved for a user's region and energy source.
+
+    Cached per user; a cached set from an older factor version is re-resolved.
+    """
+    base = get_active_factor_set(session)
+    cached = user_factor_cache.get(user_id)
+    if cached is not None and cached.version == base.version:
+        return cached
+
+    row = session.exec(
+        select(User.region, UserProfile.energy_source)
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .where(User.id == user_id)
+    ).first()
+    region, energy_source = row if row else (None, None)
+    resolved = resolve_factor_set(base, region, energy_source)
+    user_factor_cache.set(user_id, resolved)
+    return resolved
+
+def invalidate_user_factors(user_id: UUID):
+    """Forget a user's resolved set after their region or energy source changed."""
+    user_factor_cache.pop(user_id)
+
+def _validate_factors(factors: Dict) -> Dict[str, Dict[str, float]]:
+    """Normalize names to lowercase and reject non-positive or non-numeric factors."""
+    cleaned: Dict[str, Dict[str, float]] = {}
+    if not isinstance(factors, dict) or not factors:
+        raise ValueError("Factors must be a non-empty {category: {subcategory: factor}} mapping")
+    for category, subcategories in factors.items():
+        if not isinstance(subcategories, dict) or not subcategories:
+            raise ValueError(f"Category {category} has no subcategories")
+        for subcategory, factor in subcategories.items():
+            if isinstance(factor, bool) or not isinstance(factor, (int, float)) or factor < 0:
+                raise ValueError(f"Invalid factor for {category}/{subcategory}: {factor!r}")
+            cleaned.setdefault(category.lower(), {})[subcategory.lower()] = float(factor)
+    return cleaned
+
+def publish_factor_version(
+    session: Session,
+    factors: Dict[str, Dict[str, float]],
+    description: str = "",
+    activate: bool = True
+) -> EmissionFactorVersion:
+    """
+    Store a new factor version and optionally make it the active one.
+
+    Args:
+        session: Database session
+        factors: {category: {subcategory: kg CO2e per unit}}
+        description: Free-text note, e.g. the data source
+        activate: Switch new writes to this version immediately
+
+    Returns:
+        The stored EmissionFactorVersion
+    """
+    factors = _validate_factors(factors)
+
+    version = EmissionFactorVersion(description=description)
+    session.add(version)
+    session.flush()
+    session.add_all(
+        EmissionFactor(version_id=version.id, category=category, subcategory=subcategory, factor=factor)
+        for category, subcategories in factors.items()
+        for subcategory, factor in subcategories.items()
+    )
+    if activate:
+        _set_active(session, version.id)
+    session.commit()
+    session.refresh(version)
+    invalidate_factor_cache()
+    return version
+
+def _set_active(session: Session, version_id: int):
+    session.execute(
+        update(EmissionFactorVersion)
+        .where(EmissionFactorVersion.id != version_id)
+        .values(is_active=False)
+    )
+    session.execute(
+        update(EmissionFactorVersion)
+        .where(EmissionFactorVersion.id == version_id)
+        .values(is_active=True)
+    )
+
+def activate_factor_version(session: Session, version_id: int) -> EmissionFactorVersion:
+    """Make an existing version active (e.g. to roll back)."""
+    version = session.get(EmissionFactorVersion, version_id)
+    if not version:
+        raise ValueError(f"Unknown factor version: {version_id}")
+    _set_active(session, version_id)
+    session.commit()
+    session.refresh(version)
+    invalidate_factor_cache()
+    return version
+
+def ensure_factor_registry(session: Session) -> int:
+    """Seed version 1 from EMISSION_FACTORS if the registry is empty. Returns the active version id."""
+    version_id = _active_version_id(session)
+    if version_id is not None:
+        return version_id
+    if session.exec(select(EmissionFactorVersion.id)).first() is not None:
+        # Versions exist but none is active; don't guess which one
+        raise ValueError("No active emission factor version")
+    return publish_factor_version(session, EMISSION_FACTORS, "Built-in default factors").id
+
+def list_factor_versions(session: Session) -> List[EmissionFactorVersion]:
+    """All versions, oldest first."""
+    return list(session.exec(select(EmissionFactorVersion).order_by(EmissionFactorVersion.id)))
+
+def recalculate_entries(
+    session: Session,
+    chunk_size: int = RECALC_CHUNK_SIZE,
+    pause: float = 0.0,
+    on_progress: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Rescore every entry not yet on the active factor version.
+
+    Each entry is scored with the active version resolved for its owner's
+    current region and energy source. Entries are walked by primary key in chunks, each chunk in its own short
+    transaction. Every row update is guarded by the values that were read,
+    so an entry edited concurrently is left alone (the edit already scored it).
+    Rollups receive the co2 difference in the same transaction. Entries that
+    are already on the active version are filtered out by the query, so an
+    interrupted run resumes where it stopped when started again.
+
+    Args:
+        session: Database session
+        chunk_size: Entries per transaction
+        pause: Seconds to sleep between chunks to yield to live traffic
+        on_progress: Called with the report after every committed chunk
+
+    Returns:
+        Report dict with version, scanned, updated, skipped and chunks_committed
+    """
+    version_id = _active_version_id(session)
+    if version_id is None:
+        raise ValueError("No active emission factor version")
+    base = load_factor_set(session, version_id)
+    session.rollback()
+
+    report = {"version": version_id, "scanned": 0, "updated": 0, "skipped": 0, "chunks_committed": 0}
+    stale = or_(EmissionEntry.factor_version.is_(None), EmissionEntry.factor_version != version_id)
+    last_id = None
+
+    # Compiled once; the WHERE clause skips rows edited since they were read
+    table = EmissionEntry.__table__
+    guarded_update = (
+        update(table)
+        .where(
+            table.c.id == bindparam("b_id"),
+            or_(table.c.factor_version.is_(None), table.c.factor_version != version_id),
+            table.c.date == bindparam("b_date"),
+            table.c.category == bindparam("b_category"),
+            table.c.subcategory == bindparam("b_subcategory"),
+            table.c.quantity == bindparam("b_quantity"),
+            table.c.co2_equivalent == bindparam("b_co2"),
+        )
+        .values(co2_equivalent=bindparam("b_new_co2"), factor_version=version_id)
+    )
+
+    while True:
+        query = select(
+            EmissionEntry.id,
+            EmissionEntry.user_id,
+            EmissionEntry.date,
+            EmissionEntry.category,
+            EmissionEntry.subcategory,
+            EmissionEntry.quantity,
+            EmissionEntry.co2_equivalent,
+            User.region,
+            UserProfile.energy_source,
+        ).join(
+            User, User.id == EmissionEntry.user_id
+        ).outerjoin(
+            UserProfile, UserProfile.user_id == EmissionEntry.user_id
+        ).where(stale)
+        if last_id is not None:
+            query = query.where(EmissionEntry.id > last_id)
+        rows = session.execute(query.order_by(EmissionEntry.id).limit(chunk_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        # One vectorized pass per (region, energy source) present in the chunk
+        groups = defaultdict(list)
+        for position, row in enumerate(rows):
+            groups[(row.region, row.energy_source)].append(position)
+        co2_values = [0.0] * len(rows)
+        errors = [True] * len(rows)
+        for (region, energy_source), positions in groups.items():
+            group_co2, group_errors = calculate_emissions_batch(
+                [rows[i].category for i in positions],
+                [rows[i].subcategory for i in positions],
+                [rows[i].quantity for i in positions],
+                resolve_factor_set(base, region, energy_source).compiled
+            )
+            for i, co2, failed in zip(positions, group_co2.tolist(), group_errors.tolist()):
+                co2_values[i] = co2
+                errors[i] = failed
+
+        deltas = RollupDeltas()
+        for row, co2, failed in zip(rows, co2_values, errors):
+            if failed:
+                # Subcategory missing from this version, keep the old value
+                report["skipped"] += 1
+                continue
+            result = session.execute(guarded_update, {
+                "b_id": row.id,
+                "b_date": row.date,
+                "b_category": row.category,
+                "b_subcategory": row.subcategory,
+                "b_quantity": row.quantity,
+                "b_co2": row.co2_equivalent,
+                "b_new_co2": co2,
+            })
+            if result.rowcount:
+                report["updated"] += 1
+                deltas.add(row.user_id, row.date, row.category, row.co2_equivalent, -1)
+                deltas.add(row.user_id, row.date, row.category, co2)
+        apply_rollup_deltas(session, deltas)
+        session.commit()
+        for user_id in {row.user_id for row in rows}:
+            invalidate_recommendations(user_id)
+
+        report["scanned"] += len(rows)
+        report["chunks_committed"] += 1
+        if on_progress:
+            on_progress(report)
+        if pause:
+            time.sleep(pause)
+
+    return report
@@ -0,0 +1,65 @@
+"""
+Conditional GETs for per-user dashboard data.
+User.data_version is bumped in the same transaction as every write that can
+change what the dashboards show: emission entries (through
+apply_rollup_deltas), rollup rebuilds and profile updates. ETags derive from
+it, so a matching If-None-Match is answered with 304 after one primary-key
+lookup, before any emission query runs.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import UUID
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.database import async_engine
+from app.models import User
+
+# GET endpoints whose responses depend only on the user's data, the query
+# string and the UTC day (default months and the 30-day window roll daily)
+CONDITIONAL_GET_PATHS = frozenset({
+    "/api/emissions/history",
+    "/api/emissions/breakdown",
+    "/api/emissions/trend",
+    "/api/emissions/analytics",
+    "/api/recommendations",
+    "/api/profile",
+})
+
+# Clients may store responses but must revalidate before reuse
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+conditional_get_stats = {"etags_issued": 0, "not_modified": 0}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, so W/ prefixes are ignored)."""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or opaque in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def bump_data_versions(session: Session, user_ids: Optional[Iterable[UUID]] = None) -> None:
+    """Increment data_version for user_ids (None = every user) in the caller's transaction."""
+    stmt = update(User).values(data_version=User.data_version + 1)
+    if user_ids is not None:
+        stmt = stmt.where(User.id.in_(list(user_ids)))
+    session.execute(stmt)
+
+async def get_data_version(user_id: UUID) -> Optional[int]:
+    """Current data_version of a user, or None if the user does not exist."""
+    async with async_engine.connect() as connection:
+        result = await connection.execute(select(User.data_version).where(User.id == user_id))
+        return result.scalar_one_or_none()
+
+def data_etag(user_id: UUID, version: int, path: str, query: str) -> str:
+    """Weak ETag for one user's view of path?query at a data version, valid for the UTC day."""
+    day = datetime.utcnow().date().isoformat()
+    digest = hashlib.sha256(f"{user_id}:{version}:{day}:{path}?{query}".encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+def get_conditional_get_stats() -> dict:
+    """Counters for monitoring."""
+    return dict(conditional_get_stats)
@@ -0,0 +1,147 @@
+"""
+Streaming bulk import of historical emission data.
+Reads CSV or NDJSON exports record by record and writes them in fixed-size
+chunks, so memory stays flat regardless of file size.
+"""
+
+import csv
+import io
+import json
+from typing import BinaryIO, Callable, Dict, Iterator, Optional
+from uuid import UUID
+from pydantic import ValidationError
+from sqlmodel import Session
+
+from app.schemas import EmissionEntryCreate
+from app.services.emissions import build_entry_rows, insert_entry_rows
+from app.services.factors import get_user_factor_set
+
+# Records written per transaction
+IMPORT_CHUNK_SIZE = 1000
+
+# Only the first errors are kept in the report to keep memory bounded
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+def detect_format(filename: Optional[str]) -> Optional[str]:
+    """Guess import format from a file name."""
+    if not filename:
+        return None
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+def iter_records(stream: BinaryIO, fmt: str) -> Iterator[Dict]:
+    """Yield raw records from a binary CSV or NDJSON stream, one at a time."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            for record in csv.DictReader(text):
+                # Empty CSV cells mean "not provided"
+                yield {k: v for k, v in record.items() if k and v != ""}
+        else:
+            for line in text:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield {"__error__": "Invalid JSON line"}
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    # Valid JSON but not a record (5, null, [...])
+                    yield {"__error__": "JSON line is not an object"}
+    finally:
+        # Don't let the wrapper close the caller's stream
+        text.detach()
+
+def import_emissions(
+    session: Session,
+    user_id: UUID,
+    stream: BinaryIO,
+    fmt: str,
+    resume_from: int = 0,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    on_progress: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Import emission records from a CSV or NDJSON stream.
+
+    Args:
+        session: Database session
+        user_id: Owner of the imported entries
+        stream: Binary file object positioned at the start of the file
+        fmt: "csv" or "ndjson"
+        resume_from: Number of leading records to skip (records_committed of a previous run)
+        chunk_size: Records per transaction
+        on_progress: Called with the report after every committed chunk
+
+    Returns:
+        Report dict with records_committed, created, failed, chunks_committed and errors
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+    report = {
+        "records_committed": resume_from,
+        "created": 0,
+        "failed": 0,
+        "chunks_committed": 0,
+        "errors": [],
+    }
+
+    # One factor version for the whole file
+    factor_set = get_user_factor_set(session, user_id)
+
+    def add_error(index: int, detail: str):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"index": index, "detail": detail})
+
+    def flush(items, positions, records_read):
+        rows, errors = build_entry_rows(user_id, items, factor_set)
+        for item_index, detail in errors:
+            add_error(positions[item_index], detail)
+        insert_entry_rows(session, rows)
+        session.commit()
+        report["created"] += len(rows)
+        report["records_committed"] = records_read
+        report["chunks_committed"] += 1
+        if on_progress:
+            on_progress(report)
+
+    items = []
+    positions = []
+    records_read = 0
+
+    for index, record in enumerate(iter_records(stream, fmt)):
+        records_read = index + 1
+        if index < resume_from:
+            continue
+
+        if "__error__" in record:
+            add_error(index, record["__error__"])
+        else:
+            try:
+                items.append(EmissionEntryCreate.model_validate(record))
+                positions.append(index)
+            except ValidationError as e:
+                add_error(index, "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+
+        if records_read - report["records_committed"] >= chunk_size:
+            flush(items, positions, records_read)
+            items, positions = [], []
+
+    if records_read > report["records_committed"]:
+        flush(items, positions, records_read)
+
+    return report
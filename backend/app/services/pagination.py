@@ -0,0 +1,25 @@
+"""
+Opaque keyset cursors for paginated endpoints.
+A cursor encodes the sort key of the last row of a page, so the next page
+starts with an index seek instead of scanning and discarding skipped rows.
+"""
+
+import base64
+import json
+from datetime import datetime, date as date_type
+from typing import Optional, Tuple
+from uuid import UUID
+
+def encode_cursor(date: date_type, created_at: datetime, entry_id: UUID) -> str:
+    """Encode a (date, created_at, id) sort key as an opaque token."""
+    raw = json.dumps([date.isoformat(), created_at.isoformat(), entry_id.hex], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[Tuple[date_type, datetime, UUID]]:
+    """Decode a token produced by encode_cursor. Returns None if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, created_at, entry_id = json.loads(base64.urlsafe_b64decode(padded))
+        return date_type.fromisoformat(date), datetime.fromisoformat(created_at), UUID(entry_id)
+    except (ValueError, TypeError):
+        return None
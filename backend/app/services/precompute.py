@@ -0,0 +1,191 @@
+"""
+Nightly recommendation precomputation.
+precompute_recommendations ranks every user's recommendations for the day
+from one grouped aggregate over the daily rollups (users LEFT JOIN rollups,
+so users without recent entries get an empty ranking), streamed in user-id
+order and written to PrecomputedRecommendation in chunks. The user-id space
+can be split into ranges scored by a process pool. Each range resumes after
+the last user it already wrote for the day.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+import numpy as np
+from sqlalchemy import and_, func, true
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import EmissionDailyRollup, PrecomputedRecommendation, User
+from app.services.recommendations import COMPILED_RULES, score_recommendations_batch, selected_recommendation_ids
+from app.services.rollups import dialect_insert
+
+# Users scored and written per transaction
+PRECOMPUTE_CHUNK_SIZE = 1000
+
+def _partition_bounds(partitions: int) -> List[Tuple[Optional[UUID], Optional[UUID]]]:
+    """Split the UUID space into contiguous [lower, upper) ranges (None = unbounded)."""
+    step = 2 ** 128 // partitions
+    edges = [None] + [UUID(int=step * i) for i in range(1, partitions)] + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _in_range(column, lower: Optional[UUID], upper: Optional[UUID], exclusive_lower: bool = False):
+    conditions = []
+    if lower is not None:
+        conditions.append(column > lower if exclusive_lower else column >= lower)
+    if upper is not None:
+        conditions.append(column < upper)
+    return and_(true(), *conditions)
+
+def _resume_after(session: Session, day: date, lower: Optional[UUID], upper: Optional[UUID]) -> Optional[UUID]:
+    """Last user in the range already written for `day` (ranges are written in id order)."""
+    # ORDER BY ... LIMIT 1 rather than max(): PostgreSQL has no max(uuid)
+    return session.exec(
+        select(PrecomputedRecommendation.user_id).where(
+            (PrecomputedRecommendation.day == day) &
+            _in_range(PrecomputedRecommendation.user_id, lower, upper)
+        ).order_by(PrecomputedRecommendation.user_id.desc()).limit(1)
+    ).first()
+
+def _write_chunk(session: Session, user_ids: List[UUID], totals: List[List[float]], day: date, computed_at: datetime):
+    """Score a chunk and upsert its rankings (commits)."""
+    # Keep every applicable rule; the API applies the caller's limit
+    selected, _ = score_recommendations_batch(np.array(totals), limit=len(COMPILED_RULES["ids"]))
+    table = PrecomputedRecommendation.__table__
+    stmt = dialect_insert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            "day": stmt.excluded.day,
+            "recommendation_ids": stmt.excluded.recommendation_ids,
+            "computed_at": stmt.excluded.computed_at,
+        },
+        # Entries written after the totals were read win over this ranking
+        where=table.c.invalidated_at.is_(None) | (table.c.invalidated_at < stmt.excluded.computed_at),
+    )
+    session.execute(stmt, [
+        {
+            "user_id": user_id,
+            "day": day,
+            "recommendation_ids": ",".join(selected_recommendation_ids(row)),
+            "computed_at": computed_at,
+        }
+        for user_id, row in zip(user_ids, selected)
+    ])
+    session.commit()
+
+def precompute_range(
+    lower: Optional[UUID],
+    upper: Optional[UUID],
+    day: date,
+    chunk_size: int = PRECOMPUTE_CHUNK_SIZE,
+    restart: bool = False,
+    on_progress: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Precompute rankings for users with lower <= id < upper.
+
+    Args:
+        lower: First user id of the range (None = unbounded)
+        upper: End of the range, exclusive (None = unbounded)
+        day: UTC day whose 30-day window is scored
+        chunk_size: Users written per transaction
+        restart: Ignore rows already written for `day` and redo the range
+        on_progress: Called with the report after every committed chunk
+
+    Returns:
+        Report dict with users and chunks_committed
+    """
+    report = {"users": 0, "chunks_committed": 0}
+    columns = COMPILED_RULES["category_columns"]
+    since = day - timedelta(days=30)
+
+    # Reads stream on one connection while chunks commit on another
+    with Session(engine) as read_session, Session(engine) as write_session:
+        after = None if restart else _resume_after(read_session, day, lower, upper)
+        query = select(
+            User.id,
+            EmissionDailyRollup.category,
+            func.sum(EmissionDailyRollup.co2_total)
+        ).outerjoin(
+            EmissionDailyRollup,
+            (EmissionDailyRollup.user_id == User.id) & (EmissionDailyRollup.day >= since)
+        ).where(
+            _in_range(User.id, after, upper, exclusive_lower=True) if after is not None
+            else _in_range(User.id, lower, upper)
+        ).group_by(User.id, EmissionDailyRollup.category).order_by(User.id).execution_options(
+            yield_per=chunk_size * len(columns)
+        )
+
+        # Taken before the read so writes racing the job invalidate its rows
+        computed_at = datetime.utcnow()
+        user_ids: List[UUID] = []
+        totals: List[List[float]] = []
+        for user_id, category, co2 in read_session.execute(query):
+            if not user_ids or user_ids[-1] != user_id:
+                if len(user_ids) == chunk_size:
+                    _write_chunk(write_session, user_ids, totals, day, computed_at)
+                    report["users"] += len(user_ids)
+                    report["chunks_committed"] += 1
+                    if on_progress:
+                        on_progress(report)
+                    user_ids, totals = [], []
+                user_ids.append(user_id)
+                totals.append([0.0] * len(columns))
+            if category in columns:
+                totals[-1][columns[category]] = co2
+
+        if user_ids:
+            _write_chunk(write_session, user_ids, totals, day, computed_at)
+            report["users"] += len(user_ids)
+            report["chunks_committed"] += 1
+            if on_progress:
+                on_progress(report)
+
+    return report
+
+def precompute_recommendations(
+    workers: int = 1,
+    chunk_size: int = PRECOMPUTE_CHUNK_SIZE,
+    restart: bool = False,
+    on_progress: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Precompute today's rankings for every user.
+
+    Args:
+        workers: Processes to split the user-id space across (1 runs inline)
+        chunk_size: Users written per transaction
+        restart: Redo users already written today instead of resuming
+        on_progress: Called with the running report after every chunk
+            (inline) or every finished range (workers > 1)
+
+    Returns:
+        Report dict with day, users, chunks_committed and ranges
+    """
+    day = datetime.utcnow().date()
+    ranges = _partition_bounds(max(workers, 1))
+    report = {"day": day, "users": 0, "chunks_committed": 0, "ranges": len(ranges)}
+
+    if len(ranges) == 1:
+        def on_chunk(range_report):
+            if on_progress:
+                on_progress({**report, **range_report})
+        report.update(precompute_range(None, None, day, chunk_size, restart, on_chunk))
+        return report
+
+    # spawn: workers build their own engine instead of inheriting pooled connections
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(precompute_range, lower, upper, day, chunk_size, restart)
+            for lower, upper in ranges
+        ]
+        for future in as_completed(futures):
+            range_report = future.result()
+            report["users"] += range_report["users"]
+            report["chunks_committed"] += range_report["chunks_committed"]
+            if on_progress:
+                on_progress(report)
+    return report
@@ -0,0 +1,138 @@
+"""
+Read models for the hot read paths.
+Each row type is a NamedTuple whose field names are the columns it selects,
+so queries load only those columns and results are plain tuples: no ORM
+instances, identity map or change tracking. Aggregates over the daily
+rollups label their columns with the row type's field names.
+"""
+
+from datetime import date, datetime
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Type
+from uuid import UUID
+from sqlalchemy import cast, func, type_coerce, Date
+from sqlmodel import select
+
+from app.database import IS_SQLITE
+from app.models import EmissionEntry, EmissionDailyRollup, PrecomputedRecommendation
+
+class EntryRow(NamedTuple):
+    """Emission entry in EmissionEntryResponse field order."""
+    id: UUID
+    user_id: UUID
+    category: str
+    subcategory: str
+    quantity: float
+    unit: str
+    co2_equivalent: float
+    date: date
+    notes: Optional[str]
+    created_at: datetime
+
+class CategoryTotal(NamedTuple):
+    """CO2 for one category."""
+    category: str
+    co2_total: float
+
+class DailyCategoryTotal(NamedTuple):
+    """CO2 for one category on one day."""
+    day: date
+    category: str
+    co2_total: float
+
+class UserCategoryTotal(NamedTuple):
+    """CO2 for one category of one user."""
+    user_id: UUID
+    category: str
+    co2_total: float
+
+class BucketCategoryTotal(NamedTuple):
+    """CO2 for one category in one day/week/month/year bucket."""
+    bucket: date
+    category: str
+    co2_total: float
+
+class PrecomputedIds(NamedTuple):
+    """A user's precomputed ranking (comma-separated ids, None once stale)."""
+    day: Optional[date]
+    recommendation_ids: Optional[str]
+
+def as_rows(row_type: Type[NamedTuple], result: Iterable) -> List:
+    """Materialize result rows as row_type tuples."""
+    return list(map(row_type._make, result))
+
+def entry_rows_query(*criteria):
+    """Select the EntryRow columns of the entries matching criteria."""
+    return select(*(getattr(EmissionEntry, field) for field in EntryRow._fields)).where(*criteria)
+
+def daily_totals_query(user_id: UUID, start: date, end: date):
+    """DailyCategoryTotal rows for start <= day < end."""
+    return select(
+        EmissionDailyRollup.day,
+        EmissionDailyRollup.category,
+        EmissionDailyRollup.co2_total
+    ).where(
+        (EmissionDailyRollup.user_id == user_id) &
+        (EmissionDailyRollup.day >= start) &
+        (EmissionDailyRollup.day < end)
+    )
+
+def category_totals_query(user_id: UUID, since: date):
+    """CategoryTotal rows for one user since `since`."""
+    return select(
+        EmissionDailyRollup.category,
+        func.sum(EmissionDailyRollup.co2_total).label("co2_total")
+    ).where(
+        (EmissionDailyRollup.user_id == user_id) &
+        (EmissionDailyRollup.day >= since)
+    ).group_by(EmissionDailyRollup.category)
+
+def user_category_totals_query(user_ids: Sequence[UUID], since: date):
+    """UserCategoryTotal rows for several users since `since`."""
+    return select(
+        EmissionDailyRollup.user_id,
+        EmissionDailyRollup.category,
+        func.sum(EmissionDailyRollup.co2_total).label("co2_total")
+    ).where(
+        EmissionDailyRollup.user_id.in_(list(user_ids)) &
+        (EmissionDailyRollup.day >= since)
+    ).group_by(EmissionDailyRollup.user_id, EmissionDailyRollup.category)
+
+def _bucket_column(granularity: str):
+    """SQL expression for the bucket start of EmissionDailyRollup.day, as a Date."""
+    day = EmissionDailyRollup.day
+    if granularity == "day":
+        return day
+    if IS_SQLITE:
+        # SQLite stores dates as ISO text, so bucket starts are computed as text
+        if granularity == "week":
+            bucket = func.date(day, "weekday 0", "-6 days")
+        elif granularity == "month":
+            bucket = func.strftime("%Y-%m-01", day)
+        else:
+            bucket = func.strftime("%Y-01-01", day)
+        return type_coerce(bucket, Date)
+    return cast(func.date_trunc(granularity, day), Date)
+
+def bucket_totals_query(user_id: UUID, granularity: str, start: date, end: date):
+    """
+    BucketCategoryTotal rows for start <= day < end.
+
+    Buckets are keyed by their first day; weeks start on Monday.
+    """
+    bucket = _bucket_column(granularity)
+    return select(
+        bucket.label("bucket"),
+        EmissionDailyRollup.category,
+        func.sum(EmissionDailyRollup.co2_total).label("co2_total")
+    ).where(
+        (EmissionDailyRollup.user_id == user_id) &
+        (EmissionDailyRollup.day >= start) &
+        (EmissionDailyRollup.day < end)
+    ).group_by(bucket, EmissionDailyRollup.category)
+
+def precomputed_ids_query(user_id: UUID):
+    """The PrecomputedIds row of one user."""
+    return select(
+        PrecomputedRecommendation.day,
+        PrecomputedRecommendation.recommendation_ids
+    ).where(PrecomputedRecommendation.user_id == user_id)
@@ -1,15 +1,32 @@
 """
 Recommendation engine for carbon footprint reduction.
 Provides personalized suggestions based on user's emission patterns.
+
+A user's ranked recommendations only change when their entries do, so they
+are cached per user until the next UTC midnight (when the 30-day window
+moves) or until an emission write calls invalidate_recommendations. On a
+cache miss, today's ranking from the precompute job (app.services.precompute)
+is used when present and still valid; otherwise it is ranked live.
+Async handlers use the _async variants, which keep the SQLite cache
+backend's file I/O off the event loop.
 """
 
-from typing import List, Dict, Tuple
-from sqlmodel import Session, select
-from app.models import EmissionEntry
+import threading
+import time
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.database import settings
+from app.services.cache import SQLiteCache, TTLCache
+from app.services.read_models import category_totals_query, user_category_totals_query, precomputed_ids_query
 from uuid import UUID
 from datetime import datetime, timedelta
 
-# Recommendation rules: (condition_function, action, savings, priority, difficulty)
+# Recommendation rules. A rule applies when the user's CO2 in its category over
+# the last 30 days is above `threshold`; applicable rules rank by priority, then savings.
 RECOMMENDATIONS = [
     {
         "id": "transit_switch",
@@ -19,7 +36,7 @@ RECOMMENDATIONS = [
         "savings": 1.5,  # kg CO2 per week
         "priority": "high",
         "difficulty": "easy",
-        "condition": lambda user_transport: user_transport > 40  # kg/month
+        "threshold": 40,  # kg/month
     },
     {
         "id": "carpool",
@@ -29,7 +46,7 @@ RECOMMENDATIONS = [
         "savings": 0.8,  # kg CO2 per week
         "priority": "medium",
         "difficulty": "medium",
-        "condition": lambda user_transport: user_transport > 30  # kg/month
+        "threshold": 30,  # kg/month
     },
     {
         "id": "electric_vehicle",
@@ -39,7 +56,7 @@ RECOMMENDATIONS = [
         "savings": 10.0,  # kg CO2 per week estimate
         "priority": "high",
         "difficulty": "hard",
-        "condition": lambda user_transport: user_transport > 50  # kg/month
+        "threshold": 50,  # kg/month
     },
     {
         "id": "reduce_flights",
@@ -49,7 +66,7 @@ RECOMMENDATIONS = [
         "savings": 200.0,  # kg CO2 per flight avoided
         "priority": "high",
         "difficulty": "hard",
-        "condition": lambda user_transport: user_transport > 100  # Very high transport emissions
+        "threshold": 100,  # Very high transport emissions
     },
     {
         "id": "thermostat_adjust",
@@ -59,7 +76,7 @@ RECOMMENDATIONS = [
         "savings": 2.3,  # kg CO2 per week
         "priority": "medium",
         "difficulty": "easy",
-        "condition": lambda user_energy: user_energy > 400  # kWh/month
+        "threshold": 400,  # kWh/month
     },
     {
         "id": "led_lighting",
@@ -69,7 +86,7 @@ RECOMMENDATIONS = [
         "savings": 1.5,  # kg CO2 per week
         "priority": "medium",
         "difficulty": "easy",
-        "condition": lambda user_energy: user_energy > 300  # kWh/month
+        "threshold": 300,  # kWh/month
     },
     {
         "id": "renewable_energy",
@@ -79,7 +96,7 @@ RECOMMENDATIONS = [
         "savings": 5.0,  # kg CO2 per week (depends on grid mix)
         "priority": "high",
         "difficulty": "medium",
-        "condition": lambda user_energy: user_energy > 200  # kWh/month
+        "threshold": 200,  # kWh/month
     },
     {
         "id": "beef_reduction",
@@ -89,7 +106,7 @@ RECOMMENDATIONS = [
         "savings": 1.2,  # kg CO2 per week
         "priority": "high",
         "difficulty": "easy",
-        "condition": lambda user_food: user_food > 50  # kg/month (high meat consumption)
+        "threshold": 50,  # kg/month (high meat consumption)
     },
     {
         "id": "meatless_monday",
@@ -99,7 +116,7 @@ RECOMMENDATIONS = [
         "savings": 4.0,  # kg CO2 per week
         "priority": "high",
         "difficulty": "medium",
-        "condition": lambda user_food: user_food > 40  # kg/month
+        "threshold": 40,  # kg/month
     },
     {
         "id": "vegan_transition",
@@ -109,7 +126,7 @@ RECOMMENDATIONS = [
         "savings": 20.0,  # kg CO2 per week estimate
         "priority": "high",
         "difficulty": "hard",
-        "condition": lambda user_food: user_food > 100  # kg/month
+        "threshold": 100,  # kg/month
     },
     {
         "id": "local_food",
@@ -119,10 +136,89 @@ RECOMMENDATIONS = [
         "savings": 0.5,  # kg CO2 per week
         "priority": "low",
         "difficulty": "easy",
-        "condition": lambda user_food: user_food > 30  # kg/month
+        "threshold": 30,  # kg/month
     },
 ]
 
+RECOMMENDATIONS_BY_ID = {rec["id"]: rec for rec in RECOMMENDATIONS}
+
+RECOMMENDATION_CATEGORIES = ("transport", "energy", "food")
+PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+def compile_rules(rules: List[Dict], categories: Sequence[str] = RECOMMENDATION_CATEGORIES) -> Dict:
+    """
+    Pre-sort rules by (priority, -savings) into parallel arrays.
+    
+    Returns a dict with the category -> totals column mapping, the sorted
+    rule ids, each rule's column, threshold and savings as arrays, and
+    (id, column, threshold) tuples for scoring a single user without numpy
+    overhead. Rules in other categories are dropped.
+    """
+    columns = {name: column for column, name in enumerate(categories)}
+    ordered = sorted(
+        (rule for rule in rules if rule["category"] in columns),
+        key=lambda rule: (PRIORITY_ORDER.get(rule["priority"], 3), -rule["savings"])
+    )
+    return {
+        "category_columns": columns,
+        "ids": [rule["id"] for rule in ordered],
+        "columns": np.array([columns[rule["category"]] for rule in ordered], dtype=np.int64),
+        "thresholds": np.array([rule["threshold"] for rule in ordered], dtype=np.float64),
+        "savings": np.array([rule["savings"] for rule in ordered], dtype=np.float64),
+        "rules": [(rule["id"], columns[rule["category"]], rule["threshold"]) for rule in ordered],
+    }
+
+COMPILED_RULES = compile_rules(RECOMMENDATIONS)
+
+def _build_cache():
+    size = max(settings.RECOMMENDATION_CACHE_SIZE, 1)
+    if settings.RECOMMENDATION_CACHE_BACKEND == "sqlite":
+        return SQLiteCache(settings.RECOMMENDATION_CACHE_PATH, maxsize=size)
+    return TTLCache(maxsize=size)
+
+# User id -> ranked recommendation ids (ids rather than dicts so any backend can store them)
+recommendation_cache = _build_cache()
+_compute_lock = threading.Lock()
+_compute_stats = {"computed": 0, "seconds": 0.0}
+
+def _seconds_until_utc_midnight() -> float:
+    now = datetime.utcnow()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds()
+
+async def _run_cache_call(func, *args, **kwargs):
+    """Call a cache method, in the threadpool when the backend does blocking file I/O."""
+    if isinstance(recommendation_cache, SQLiteCache):
+        return await run_in_threadpool(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+def invalidate_recommendations(user_id: Optional[UUID] = None):
+    """Forget a user's cached recommendations after their entries changed (all users if None)."""
+    if user_id is None:
+        recommendation_cache.clear()
+    else:
+        recommendation_cache.pop(str(user_id))
+
+async def invalidate_recommendations_async(user_id: Optional[UUID] = None):
+    """invalidate_recommendations for async handlers."""
+    await _run_cache_call(invalidate_recommendations, user_id)
+
+def get_recommendation_cache_stats() -> Dict:
+    """Cache counters plus the scoring time that hits avoided."""
+    stats = recommendation_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    with _compute_lock:
+        computed, seconds = _compute_stats["computed"], _compute_stats["seconds"]
+    avg_compute_ms = seconds / computed * 1000 if computed else 0.0
+    return {
+        **stats,
+        "backend": settings.RECOMMENDATION_CACHE_BACKEND,
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "avg_compute_ms": round(avg_compute_ms, 3),
+        # Every hit skipped one computation of roughly average cost
+        "saved_ms": round(stats["hits"] * avg_compute_ms, 1),
+    }
+
 def get_recommendations(
     session: Session,
     user_id: UUID,
@@ -139,72 +235,165 @@ def get_recommendations(
     Returns:
         Tuple of (list of recommendations, total potential savings in kg CO2/week)
     """
+    ranked_ids = None
+    if settings.RECOMMENDATION_CACHE_SIZE:
+        ranked_ids = recommendation_cache.get(str(user_id))
     
-    # Get last 30 days of emissions for user
-    thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d")
+    if ranked_ids is None:
+        ranked_ids = _compute_ranked_ids(session, user_id)
+        if settings.RECOMMENDATION_CACHE_SIZE:
+            recommendation_cache.set(str(user_id), ranked_ids, ttl=_seconds_until_utc_midnight())
     
-    query = select(EmissionEntry).where(
-        (EmissionEntry.user_id == user_id) &
-        (EmissionEntry.date >= thirty_days_ago)
-    )
-    entries = session.exec(query).all()
-    
-    # Calculate totals by category
-    category_totals = {
-        "transport": 0,
-        "energy": 0,
-        "food": 0
-    }
+    return _limit_recommendations(ranked_ids, limit)
+
+async def get_recommendations_async(
+    session: AsyncSession,
+    user_id: UUID,
+    limit: int = 5
+) -> Tuple[List[Dict], float]:
+    """get_recommendations for async handlers; cache calls never block the event loop."""
+    ranked_ids = None
+    if settings.RECOMMENDATION_CACHE_SIZE:
+        ranked_ids = await _run_cache_call(recommendation_cache.get, str(user_id))
     
-    for entry in entries:
-        if entry.category in category_totals:
-            category_totals[entry.category] += entry.co2_equivalent
-    
-    # Evaluate recommendations
-    applicable_recommendations = []
-    
-    for rec in RECOMMENDATIONS:
-        try:
-            if rec["category"] == "transport":
-                if rec["condition"](category_totals["transport"]):
-                    applicable_recommendations.append(rec)
-            elif rec["category"] == "energy":
-                if rec["condition"](category_totals["energy"]):
-                    applicable_recommendations.append(rec)
-            elif rec["category"] == "food":
-                if rec["condition"](category_totals["food"]):
-                    applicable_recommendations.append(rec)
-        except (TypeError, ValueError):
-            # Skip if condition evaluation fails
-            continue
-    
-    # Sort by priority (high > medium > low) then by savings
-    priority_order = {"high": 0, "medium": 1, "low": 2}
-    applicable_recommendations.sort(
-        key=lambda x: (
-            priority_order.get(x["priority"], 3),
-            -x["savings"]
-        )
-    )
+    if ranked_ids is None:
+        ranked_ids = await session.run_sync(_compute_ranked_ids, user_id)
+        if settings.RECOMMENDATION_CACHE_SIZE:
+            await _run_cache_call(
+                recommendation_cache.set, str(user_id), ranked_ids, ttl=_seconds_until_utc_midnight()
+            )
     
+    return _limit_recommendations(ranked_ids, limit)
+
+def _compute_ranked_ids(session: Session, user_id: UUID) -> List[str]:
+    """Precomputed or live ranking for a cache miss, timed for the cache stats."""
+    started = time.perf_counter()
+    ranked_ids = get_precomputed_recommendation_ids(session, user_id)
+    if ranked_ids is None:
+        ranked_ids = rank_recommendations(session, user_id)
+    elapsed = time.perf_counter() - started
+    with _compute_lock:
+        _compute_stats["computed"] += 1
+        _compute_stats["seconds"] += elapsed
+    return ranked_ids
+
+def _limit_recommendations(ranked_ids: List[str], limit: int) -> Tuple[List[Dict], float]:
     # Limit results
-    recommendations = applicable_recommendations[:limit]
+    recommendations = [RECOMMENDATIONS_BY_ID[rec_id] for rec_id in ranked_ids[:limit]]
     
     # Calculate total potential savings
     total_savings = sum(rec["savings"] for rec in recommendations)
     
     return recommendations, total_savings
 
-def get_all_recommendations(limit: int = 10) -> List[Dict]:
-    """Get all available recommendations (for reference)."""
-    sorted_recs = sorted(
-        RECOMMENDATIONS,
-        key=lambda x: (-EMISSION_FACTORS.get(x["category"], {}).get(x["id"], 0), x["id"])
-    )
-    return sorted_recs[:limit]
+def get_precomputed_recommendation_ids(session: Session, user_id: UUID) -> Optional[List[str]]:
+    """Today's ranking from the precompute job, or None if missing, stale or from another day."""
+    row = session.exec(precomputed_ids_query(user_id)).first()
+    if row is None or row.recommendation_ids is None or row.day != datetime.utcnow().date():
+        return None
+    # Rules removed since the job ran are skipped
+    return [rec_id for rec_id in row.recommendation_ids.split(",") if rec_id in RECOMMENDATIONS_BY_ID]
+
+def rank_recommendations(session: Session, user_id: UUID) -> List[str]:
+    """
+    Rank every applicable recommendation for a user, bypassing the cache.
+    
+    Args:
+        session: Database session
+        user_id: User ID
+    
+    Returns:
+        Recommendation ids, best first
+    """
+    
+    # Get last 30 days of emissions for user
+    thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).date()
+    
+    # Calculate totals by category
+    columns = COMPILED_RULES["category_columns"]
+    totals = [0.0] * len(columns)
+    for category, co2 in session.exec(category_totals_query(user_id, thirty_days_ago)):
+        if category in columns:
+            totals[columns[category]] += co2
+    
+    # Rules are already in rank order, so one threshold pass yields the ranking
+    return [rule_id for rule_id, column, threshold in COMPILED_RULES["rules"] if totals[column] > threshold]
+
+def load_category_totals(session: Session, user_ids: Sequence[UUID]) -> np.ndarray:
+    """
+    Last-30-day CO2 per user and category, for batch scoring.
+    
+    Args:
+        session: Database session
+        user_ids: Users to load, one row each in this order (keep chunks
+            below the database's bound-parameter limit)
+    
+    Returns:
+        (users x RECOMMENDATION_CATEGORIES) matrix of kg CO2
+    """
+    thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).date()
+    rows_by_user = {user_id: row for row, user_id in enumerate(user_ids)}
+    columns = COMPILED_RULES["category_columns"]
+    totals = np.zeros((len(user_ids), len(columns)))
+    if not user_ids:
+        return totals
+    
+    for user_id, category, co2 in session.exec(user_category_totals_query(user_ids, thirty_days_ago)):
+        if category in columns:
+            totals[rows_by_user[user_id], columns[category]] = co2
+    return totals
+
+def score_recommendations_batch(totals: np.ndarray, limit: int = 5, compiled: Dict = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized ranking for many users at once (e.g. digest emails).
+    
+    Args:
+        totals: (users x categories) matrix from load_category_totals
+        limit: Maximum number of recommendations per user
+        compiled: Rules from compile_rules (defaults to RECOMMENDATIONS)
+    
+    Returns:
+        Tuple of (users x rules boolean matrix of selected rules, in the
+        order of compiled["ids"], and total potential savings per user).
+        Selections match get_recommendations for the same totals.
+    """
+    compiled = compiled or COMPILED_RULES
+    totals = np.asarray(totals, dtype=np.float64)
+    applicable = totals[:, compiled["columns"]] > compiled["thresholds"]
+    # Rules are in rank order: keep each user's first `limit` applicable ones
+    selected = applicable & (np.cumsum(applicable, axis=1) <= limit)
+    return selected, selected @ compiled["savings"]
+
+def selected_recommendation_ids(selected_row: np.ndarray, compiled: Dict = None) -> List[str]:
+    """Rule ids for one row of score_recommendations_batch's selection, best first."""
+    compiled = compiled or COMPILED_RULES
+    return [compiled["ids"][index] for index in np.flatnonzero(selected_row)]
+
+# Every recommendation, largest savings first (ties by id); built once, read-only
+CATALOG: Tuple[Mapping, ...] = tuple(
+    MappingProxyType(rec) for rec in sorted(RECOMMENDATIONS, key=lambda rec: (-rec["savings"], rec["id"]))
+)
+DIFFICULTIES = ("easy", "medium", "hard")
+
+def _build_catalog_index() -> Dict[Tuple[Optional[str], Optional[str]], Tuple[int, ...]]:
+    """CATALOG positions for every (category, difficulty) filter, None meaning any."""
+    index = {
+        (category, difficulty): []
+        for category in (None, *RECOMMENDATION_CATEGORIES)
+        for difficulty in (None, *DIFFICULTIES)
+    }
+    for position, rec in enumerate(CATALOG):
+        for category in (None, rec["category"]):
+            for difficulty in (None, rec["difficulty"]):
+                index.setdefault((category, difficulty), []).append(position)
+    return {key: tuple(positions) for key, positions in index.items()}
+
+CATALOG_INDEX = _build_catalog_index()
+
+def get_catalog(category: Optional[str] = None, difficulty: Optional[str] = None) -> Tuple[Mapping, ...]:
+    """Catalog entries matching the filters (unknown values match nothing)."""
+    return tuple(CATALOG[position] for position in CATALOG_INDEX.get((category, difficulty), ()))
 
-EMISSION_FACTORS = {
-    "transport": {"transit_switch": 1.5, "carpool": 0.8, "electric_vehicle": 10.0, "reduce_flights": 200.0},
-    "energy": {"thermostat_adjust": 2.3, "led_lighting": 1.5, "renewable_energy": 5.0},
-    "food": {"beef_reduction": 1.2, "meatless_monday": 4.0, "vegan_transition": 20.0, "local_food": 0.5},
-}
+def get_all_recommendations(limit: int = 10) -> List[Mapping]:
+    """Get all available recommendations (for reference), largest savings first."""
+    return list(CATALOG[:limit])
@@ -0,0 +1,171 @@
+"""
+Daily emission rollups.
+EmissionDailyRollup holds the CO2 sum and entry count per (user, day,
+category). Every write to EmissionEntry applies a matching delta in the
+same transaction, so dashboards aggregate a few rows per day instead of
+scanning raw entries. The same transaction marks the user's precomputed
+recommendations stale and bumps User.data_version.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+
+from app.models import EmissionEntry, EmissionDailyRollup, PrecomputedRecommendation
+from app.services.http_cache import bump_data_versions
+
+RollupKey = Tuple[UUID, date, str]
+
+# Allowed float drift between the rollup and a fresh SUM
+CHECK_TOLERANCE = 1e-6
+
+class RollupDeltas:
+    """Accumulates (co2, count) changes per rollup key before they are applied."""
+
+    def __init__(self):
+        self.changes: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+
+    def add(self, user_id: UUID, day: date, category: str, co2: float, sign: int = 1):
+        change = self.changes[(user_id, day, category)]
+        change[0] += sign * co2
+        change[1] += sign
+
+    def add_entry(self, entry, sign: int = 1):
+        """Record an entry (ORM object) being added (sign=1) or removed (sign=-1)."""
+        self.add(entry.user_id, entry.date, entry.category, entry.co2_equivalent, sign)
+
+    def add_rows(self, rows: Iterable[Dict]):
+        """Record newly inserted entry row dicts."""
+        for row in rows:
+            self.add(row["user_id"], row["date"], row["category"], row["co2_equivalent"])
+
+def dialect_insert(session: Session, table):
+    """INSERT supporting ON CONFLICT for the session's dialect (PostgreSQL or SQLite)."""
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+    return upsert_insert(table)
+
+def _upsert(session: Session):
+    """Dialect-specific INSERT ... ON CONFLICT that adds to the existing totals."""
+    table = EmissionDailyRollup.__table__
+    stmt = dialect_insert(session, table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day, table.c.category],
+        set_={
+            "co2_total": table.c.co2_total + stmt.excluded.co2_total,
+            "entry_count": table.c.entry_count + stmt.excluded.entry_count,
+        },
+    )
+
+def _mark_recommendations_stale(session: Session, user_ids: Iterable[UUID]):
+    """
+    Tombstone precomputed recommendations rather than deleting them: the
+    job only overwrites rows invalidated before it read the totals, so a
+    run in progress cannot restore a ranking that predates this write.
+    """
+    table = PrecomputedRecommendation.__table__
+    stmt = dialect_insert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={"recommendation_ids": None, "invalidated_at": stmt.excluded.invalidated_at},
+    )
+    now = datetime.utcnow()
+    session.execute(stmt, [{"user_id": user_id, "invalidated_at": now} for user_id in user_ids])
+
+def apply_rollup_deltas(session: Session, deltas: RollupDeltas) -> None:
+    """Apply accumulated deltas in the caller's transaction (caller commits)."""
+    # Edits that leave the totals unchanged (e.g. notes) still change the entries
+    user_ids = {user_id for user_id, _, _ in deltas.changes}
+    if user_ids:
+        bump_data_versions(session, user_ids)
+    
+    rows = [
+        {"user_id": user_id, "day": day, "category": category, "co2_total": co2, "entry_count": count}
+        for (user_id, day, category), (co2, count) in deltas.changes.items()
+        if co2 or count
+    ]
+    if not rows:
+        return
+
+    session.execute(_upsert(session), rows)
+    _mark_recommendations_stale(session, {row["user_id"] for row in rows})
+
+    if any(row["entry_count"] < 0 for row in rows):
+        # Drop days whose last entry was deleted or moved away
+        session.execute(
+            delete(EmissionDailyRollup).where(
+                EmissionDailyRollup.user_id.in_({row["user_id"] for row in rows}),
+                EmissionDailyRollup.entry_count <= 0,
+            )
+        )
+
+def _scope(query, column, user_id: Optional[UUID]):
+    """Restrict a statement to one user when user_id is given."""
+    return query.where(column == user_id) if user_id else query
+
+def rebuild_rollups(session: Session, user_id: Optional[UUID] = None) -> int:
+    """Recompute rollups from raw entries for one user (or everyone). Returns rows written."""
+    session.execute(_scope(delete(EmissionDailyRollup), EmissionDailyRollup.user_id, user_id))
+
+    aggregate = _scope(
+        select(
+            EmissionEntry.user_id,
+            EmissionEntry.date,
+            EmissionEntry.category,
+            func.sum(EmissionEntry.co2_equivalent),
+            func.count(),
+        ),
+        EmissionEntry.user_id,
+        user_id,
+    ).group_by(EmissionEntry.user_id, EmissionEntry.date, EmissionEntry.category)
+
+    result = session.execute(
+        insert(EmissionDailyRollup).from_select(
+            ["user_id", "day", "category", "co2_total", "entry_count"], aggregate
+        )
+    )
+    bump_data_versions(session, [user_id] if user_id else None)
+    session.commit()
+    return result.rowcount
+
+def check_rollups(session: Session, user_id: Optional[UUID] = None) -> List[Dict]:
+    """Compare rollups with a fresh aggregate of raw entries and list every mismatch."""
+    expected = {
+        (row[0], row[1], row[2]): (row[3], row[4])
+        for row in session.execute(
+            _scope(
+                select(
+                    EmissionEntry.user_id,
+                    EmissionEntry.date,
+                    EmissionEntry.category,
+                    func.sum(EmissionEntry.co2_equivalent),
+                    func.count(),
+                ),
+                EmissionEntry.user_id,
+                user_id,
+            ).group_by(EmissionEntry.user_id, EmissionEntry.date, EmissionEntry.category)
+        )
+    }
+
+    mismatches = []
+    for rollup in session.exec(
+        _scope(select(EmissionDailyRollup), EmissionDailyRollup.user_id, user_id)
+    ):
+        key = (rollup.user_id, rollup.day, rollup.category)
+        co2, count = expected.pop(key, (0.0, 0))
+        if count != rollup.entry_count or abs(co2 - rollup.co2_total) > CHECK_TOLERANCE * max(1.0, abs(co2)):
+            mismatches.append({
+                "key": key,
+                "expected": (co2, count),
+                "actual": (rollup.co2_total, rollup.entry_count),
+            })
+
+    for key, (co2, count) in expected.items():
+        mismatches.append({"key": key, "expected": (co2, count), "actual": (0.0, 0)})
+
+    return mismatches
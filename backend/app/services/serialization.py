@@ -0,0 +1,97 @@
+"""
+Fast JSON path for list-heavy responses.
+With FAST_JSON_RESPONSES enabled, history and breakdown encode their EntryRow
+read models directly instead of validating them through response_model.
+orjson is used when installed, stdlib json otherwise; both emit the
+EmissionEntryResponse wire format.
+"""
+
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List
+from uuid import UUID, uuid4
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from app.schemas import EmissionEntryResponse
+from app.services.read_models import EntryRow
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+def entry_dicts(rows: Iterable[EntryRow]) -> List[Dict[str, Any]]:
+    """Map EntryRow rows to response dicts."""
+    fields = EntryRow._fields
+    return [dict(zip(fields, row)) for row in rows]
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact UTF-8 JSON (UUIDs as strings, dates in ISO 8601)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """JSONResponse that encodes with dumps() and skips response_model validation."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def benchmark_serialization(rows: int = 1000, repeat: int = 20) -> Dict[str, Any]:
+    """
+    Time both response paths on synthetic entries (no database).
+
+    Args:
+        rows: Entries per response
+        repeat: Timed runs per path (the best run is reported)
+
+    Returns:
+        Report dict with ms per 1,000 rows for each path and the speedup
+    """
+    now = datetime.utcnow()
+    user_id = uuid4()
+    entries = [
+        EntryRow(uuid4(), user_id, "transport", "car_petrol", 12.5 + i, "km",
+                 round((12.5 + i) * 0.192, 4), now.date() - timedelta(days=i % 365),
+                 "commute" if i % 3 else None, now - timedelta(seconds=i))
+        for i in range(rows)
+    ]
+    adapter = TypeAdapter(List[EmissionEntryResponse])
+
+    def standard() -> bytes:
+        # What FastAPI does for response_model: validate, dump to JSON types, json.dumps
+        content = adapter.dump_python(adapter.validate_python(entries, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def fast() -> bytes:
+        return dumps(entry_dicts(entries))
+
+    if json.loads(standard()) != json.loads(fast()):
+        raise AssertionError("fast path output differs from EmissionEntryResponse")
+
+    report = {"rows": rows, "encoder": "orjson" if orjson is not None else "json"}
+    for name, func in (("standard", standard), ("fast", fast)):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        report[f"{name}_ms_per_1000"] = round(best * 1000 * 1000 / rows, 3)
+    report["speedup"] = round(report["standard_ms_per_1000"] / report["fast_ms_per_1000"], 1)
+    return report
@@ -0,0 +1,56 @@
+"""Store EmissionEntry.date as a native DATE and index date ranges.
+
+Applies on top of the schema created by create_db_and_tables() before
+migrations were introduced. Existing values are YYYY-MM-DD strings, which
+cast directly to DATE on PostgreSQL. SQLAlchemy stores SQLite dates as the
+same ISO strings, so SQLite only needs the new indexes (a batch CAST would
+turn them into integers).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        op.alter_column(
+            "emissionentry",
+            "date",
+            existing_type=sa.String(),
+            type_=sa.Date(),
+            existing_nullable=False,
+            postgresql_using="date::date",
+        )
+    op.create_index(
+        "ix_emissionentry_user_date_created_id",
+        "emissionentry",
+        ["user_id", "date", "created_at", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_emissionentry_user_date_totals",
+        "emissionentry",
+        ["user_id", "date", "category", "co2_equivalent"],
+        if_not_exists=True,
+    )
+
+def downgrade():
+    op.drop_index("ix_emissionentry_user_date_totals", table_name="emissionentry")
+    op.drop_index("ix_emissionentry_user_date_created_id", table_name="emissionentry")
+    if op.get_bind().dialect.name != "sqlite":
+        op.alter_column(
+            "emissionentry",
+            "date",
+            existing_type=sa.Date(),
+            type_=sa.String(),
+            existing_nullable=False,
+            postgresql_using="to_char(date, 'YYYY-MM-DD')",
+        )
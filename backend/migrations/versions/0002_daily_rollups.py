@@ -0,0 +1,44 @@
+"""Add the emissiondailyrollup table and backfill it from existing entries.
+
+The table may already exist (empty) if the app started against this
+database before the migration ran, so it is only created when missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table("emissiondailyrollup"):
+        op.create_table(
+            "emissiondailyrollup",
+            sa.Column("user_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("category", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("co2_total", sa.Float(), nullable=False),
+            sa.Column("entry_count", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("user_id", "day", "category"),
+        )
+
+    op.execute("DELETE FROM emissiondailyrollup")
+    op.execute(
+        """
+        INSERT INTO emissiondailyrollup (user_id, day, category, co2_total, entry_count)
+        SELECT user_id, date, category, SUM(co2_equivalent), COUNT(*)
+        FROM emissionentry
+        GROUP BY user_id, date, category
+        """
+    )
+
+def downgrade():
+    op.drop_table("emissiondailyrollup")
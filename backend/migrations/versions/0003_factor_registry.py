@@ -0,0 +1,55 @@
+"""Add the emission factor registry and EmissionEntry.factor_version.
+
+Registry tables may already exist if the app started against this database
+before the migration ran. Existing entries keep factor_version NULL until
+`python -m app.cli factors recalculate` rescores them.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("emissionfactorversion"):
+        op.create_table(
+            "emissionfactorversion",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_emissionfactorversion_is_active", "emissionfactorversion", ["is_active"])
+
+    if not inspector.has_table("emissionfactor"):
+        op.create_table(
+            "emissionfactor",
+            sa.Column("version_id", sa.Integer(), nullable=False),
+            sa.Column("category", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("subcategory", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("factor", sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(["version_id"], ["emissionfactorversion.id"]),
+            sa.PrimaryKeyConstraint("version_id", "category", "subcategory"),
+        )
+
+    columns = {column["name"] for column in inspector.get_columns("emissionentry")}
+    if "factor_version" not in columns:
+        with op.batch_alter_table("emissionentry") as batch_op:
+            batch_op.add_column(sa.Column("factor_version", sa.Integer(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table("emissionentry") as batch_op:
+        batch_op.drop_column("factor_version")
+    op.drop_table("emissionfactor")
+    op.drop_index("ix_emissionfactorversion_is_active", table_name="emissionfactorversion")
+    op.drop_table("emissionfactorversion")
@@ -0,0 +1,34 @@
+"""Add the precomputedrecommendation table.
+
+Filled by `python -m app.cli recommendations precompute`; until the first
+run the API ranks recommendations live as before.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table("precomputedrecommendation"):
+        op.create_table(
+            "precomputedrecommendation",
+            sa.Column("user_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+            sa.Column("day", sa.Date(), nullable=True),
+            sa.Column("recommendation_ids", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("computed_at", sa.DateTime(), nullable=True),
+            sa.Column("invalidated_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+
+def downgrade():
+    op.drop_table("precomputedrecommendation")
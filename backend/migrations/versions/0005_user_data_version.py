@@ -0,0 +1,27 @@
+"""Add User.data_version.
+
+Bumped in the same transaction as every write to a user's entries or
+profile; conditional GETs derive their ETags from it.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("user")}
+    if "data_version" not in columns:
+        with op.batch_alter_table("user") as batch_op:
+            batch_op.add_column(sa.Column("data_version", sa.Integer(), nullable=False, server_default="0"))
+
+def downgrade():
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.drop_column("data_version")
@@ -0,0 +1,37 @@
+"""
+Shared fixtures.
+The suite runs against in-memory SQLite (DATABASE_URL=sqlite://) with cheap
+argon2 parameters; the environment is set before the app is imported.
+"""
+
+import os
+import uuid
+
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["ARGON2_TIME_COST"] = "1"
+os.environ["ARGON2_MEMORY_COST"] = "1024"
+os.environ["ARGON2_PARALLELISM"] = "1"
+os.environ["RECOMMENDATION_CACHE_BACKEND"] = "memory"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+PASSWORD = "secret123"
+
+@pytest.fixture(scope="session")
+def client():
+    """One app instance (and in-memory database) for the whole run."""
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def auth_headers(client):
+    """Authorization header for a freshly registered user."""
+    email = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    response = client.post("/api/auth/register", json={"email": email, "full_name": "Test User", "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    response = client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,51 @@
+"""Range analytics: bucket walk and range limits."""
+
+from datetime import date
+
+import pytest
+
+ENTRY = {"category": "transport", "subcategory": "car", "quantity": 10, "unit": "km"}
+
+def _analytics(client, headers, start, end, granularity):
+    return client.get(
+        "/api/emissions/analytics",
+        params={"start": start, "end": end, "granularity": granularity},
+        headers=headers
+    )
+
+def test_buckets_and_totals(client, auth_headers):
+    created = [
+        client.post("/api/emissions", json={**ENTRY, "date": day}, headers=auth_headers).json()
+        for day in ("2025-01-31", "2025-02-01", "2025-02-28")
+    ]
+    response = _analytics(client, auth_headers, "2025-01-15", "2025-03-10", "month")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["buckets"] == ["2025-01-01", "2025-02-01", "2025-03-01"]
+    co2 = [entry["co2_equivalent"] for entry in created]
+    assert body["transport"] == [co2[0], round(co2[1] + co2[2], 2), 0.0]
+    assert body["total"] == body["transport"]
+
+@pytest.mark.parametrize("granularity, start, last_bucket", [
+    ("day", "9999-12-01", "9999-12-31"),
+    ("week", "9999-10-01", "9999-12-27"),
+    ("month", "9999-01-01", "9999-12-01"),
+    ("year", "9990-01-01", "9999-01-01"),
+])
+def test_range_ending_at_date_max(client, auth_headers, granularity, start, last_bucket):
+    client.post("/api/emissions", json={**ENTRY, "date": "9999-12-30"}, headers=auth_headers)
+    response = _analytics(client, auth_headers, start, date.max.isoformat(), granularity)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["buckets"][-1] == last_bucket
+    assert sum(body["transport"]) > 0
+
+def test_range_starting_at_date_min(client, auth_headers):
+    response = _analytics(client, auth_headers, date.min.isoformat(), "0001-01-20", "week")
+    assert response.status_code == 200, response.text
+    assert response.json()["buckets"] == ["0001-01-01", "0001-01-08", "0001-01-15"]
+
+def test_invalid_ranges_are_rejected(client, auth_headers):
+    assert _analytics(client, auth_headers, "2025-03-01", "2025-02-01", "month").status_code == 400
+    assert _analytics(client, auth_headers, "2025-01-01", "2025-02-01", "hour").status_code == 400
+    assert _analytics(client, auth_headers, "2000-01-01", "2025-01-01", "day").status_code == 400
@@ -0,0 +1,37 @@
+"""Registration and login."""
+
+from sqlmodel import Session
+
+from app.database import engine
+from app.models import User
+from app.routers import auth
+from app.services.auth import hash_password
+
+def _register(client, email):
+    return client.post("/api/auth/register", json={"email": email, "full_name": "Test User", "password": "secret123"})
+
+def test_duplicate_email_is_rejected(client):
+    assert _register(client, "twice@example.com").status_code == 200
+    response = _register(client, "twice@example.com")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+def test_concurrent_registration_of_one_email(client, monkeypatch):
+    email = "race@example.com"
+    
+    async def hash_while_another_request_registers(password):
+        # The other request commits between this one's email check and its insert
+        with Session(engine) as session:
+            session.add(User(email=email, full_name="Other", password_hash=hash_password(password), region="Global"))
+            session.commit()
+        return hash_password(password)
+    
+    monkeypatch.setattr(auth, "hash_password_async", hash_while_another_request_registers)
+    response = _register(client, email)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+def test_wrong_password_is_401(client):
+    _register(client, "login@example.com")
+    response = client.post("/api/auth/login", json={"email": "login@example.com", "password": "wrong-password"})
+    assert response.status_code == 401
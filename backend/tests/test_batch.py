@@ -0,0 +1,26 @@
+"""Batch emission ingestion."""
+
+from app.routers import emissions
+
+def _entry(**overrides):
+    return {"category": "transport", "subcategory": "car", "quantity": 10, "unit": "km", "date": "2025-03-01", **overrides}
+
+def test_batch_inserts_valid_items_and_reports_the_rest(client, auth_headers):
+    items = [_entry(), _entry(subcategory="rocket"), _entry(date="2025-02-30"), _entry(quantity=2.5)]
+    response = client.post("/api/emissions/batch", json=items, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["created"] == 2
+    assert [error["index"] for error in report["errors"]] == [1, 2]
+    
+    history = client.get("/api/emissions/history", headers=auth_headers).json()
+    assert sorted(entry["id"] for entry in history) == sorted(report["ids"])
+
+def test_empty_batch(client, auth_headers):
+    response = client.post("/api/emissions/batch", json=[], headers=auth_headers)
+    assert response.json() == {"created": 0, "ids": [], "errors": []}
+
+def test_oversized_batch_is_rejected(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(emissions, "MAX_BATCH_SIZE", 2)
+    response = client.post("/api/emissions/batch", json=[_entry()] * 3, headers=auth_headers)
+    assert response.status_code == 413
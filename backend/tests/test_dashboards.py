@@ -0,0 +1,35 @@
+"""Breakdown and trend: month windows and parameter checks."""
+
+import pytest
+
+PATHS = ["/api/emissions/breakdown", "/api/emissions/trend"]
+
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("year", [0, -5, 10000])
+def test_year_out_of_range_is_rejected(client, auth_headers, path, year):
+    response = client.get(path, params={"year": year, "month": 5}, headers=auth_headers)
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("month", [0, 13])
+def test_month_out_of_range_is_rejected(client, auth_headers, path, month):
+    response = client.get(path, params={"year": 2025, "month": month}, headers=auth_headers)
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("path", PATHS)
+def test_last_representable_month(client, auth_headers, path):
+    response = client.get(path, params={"year": 9999, "month": 12}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+
+def test_breakdown_of_first_representable_month(client, auth_headers):
+    response = client.get("/api/emissions/breakdown", params={"year": 1, "month": 1}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["summary"]["trend"] == 0.0
+
+def test_trend_is_clamped_to_first_representable_month(client, auth_headers):
+    response = client.get("/api/emissions/trend", params={"year": 1, "month": 1}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert [(m["year"], m["month"]) for m in response.json()["months"]] == [(1, 1)]
+    
+    response = client.get("/api/emissions/trend", params={"year": 1, "month": 3, "months": 6}, headers=auth_headers)
+    assert [(m["year"], m["month"]) for m in response.json()["months"]] == [(1, 1), (1, 2), (1, 3)]
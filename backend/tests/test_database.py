@@ -0,0 +1,70 @@
+"""Engines and pools: in-memory SQLite shared by both engines, timed QueuePools."""
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, select
+
+from app.database import IS_SQLITE_MEMORY, TimedQueuePool, engine
+from app.models import User
+
+def test_suite_runs_in_memory():
+    assert IS_SQLITE_MEMORY
+
+def test_login_unknown_user_is_401(client):
+    # The schema is created on the sync engine; login queries the async one
+    response = client.post("/api/auth/login", json={"email": "nobody@example.com", "password": "secret123"})
+    assert response.status_code == 401
+
+def test_async_writes_visible_to_sync_engine(client, auth_headers):
+    profile = client.get("/api/profile", headers=auth_headers).json()
+    with Session(engine) as session:
+        assert session.exec(select(User.email).where(User.email == profile["user"]["email"])).first() == profile["user"]["email"]
+
+def test_sync_import_visible_to_async_reads(client, auth_headers):
+    # Import writes through the sync engine, history reads through the async one
+    body = b'{"category": "transport", "subcategory": "car", "quantity": 10, "unit": "km", "date": "2025-03-01"}\n'
+    response = client.post("/api/emissions/import", files={"file": ("data.ndjson", body)}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 1
+    history = client.get("/api/emissions/history", headers=auth_headers).json()
+    assert [entry["subcategory"] for entry in history] == ["car"]
+
+def test_in_memory_engines_use_static_pools(client):
+    assert isinstance(engine.pool, StaticPool)
+    pools = client.get("/metrics").json()["db_pools"]
+    assert pools == {"sync": {"pool": "StaticPool"}, "async": {"pool": "StaticPool"}}
+
+def _file_engine(tmp_path, **pool_args):
+    return create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=TimedQueuePool,
+        **pool_args
+    )
+
+def test_timed_pool_gives_concurrent_sessions_their_own_connections(tmp_path):
+    file_engine = _file_engine(tmp_path, pool_size=2, max_overflow=0)
+    first = file_engine.connect()
+    second = file_engine.connect()
+    try:
+        assert first.connection.dbapi_connection is not second.connection.dbapi_connection
+        assert file_engine.pool.checkedout() == 2
+        assert file_engine.pool.stats.snapshot()["checkouts"] == 2
+    finally:
+        first.close()
+        second.close()
+        file_engine.dispose()
+
+def test_timed_pool_records_timeouts(tmp_path):
+    file_engine = _file_engine(tmp_path, pool_size=1, max_overflow=0, pool_timeout=0.05)
+    held = file_engine.connect()
+    try:
+        with pytest.raises(exc.TimeoutError):
+            file_engine.connect()
+        snapshot = file_engine.pool.stats.snapshot()
+        assert snapshot["timeouts"] == 1
+        assert snapshot["max_wait_ms"] >= 50
+    finally:
+        held.close()
+        file_engine.dispose()
@@ -0,0 +1,53 @@
+"""Emission scoring: batch rows and vectorized factors."""
+
+import uuid
+
+import numpy as np
+
+from app.schemas import EmissionEntryCreate
+from app.services.emissions import EMISSION_FACTORS, _round2, build_entry_rows, calculate_emissions, calculate_emissions_batch
+
+def _item(subcategory: str = "car", day: str = "2025-03-01") -> EmissionEntryCreate:
+    return EmissionEntryCreate(category="transport", subcategory=subcategory, quantity=10, unit="km", date=day)
+
+def test_build_entry_rows_reports_errors_by_batch_position():
+    user_id = uuid.uuid4()
+    rows, errors = build_entry_rows(user_id, [_item(), _item(day="2025-13-01"), _item(subcategory="rocket"), _item()])
+    assert len(rows) == 2
+    assert all(row["user_id"] == user_id for row in rows)
+    assert [index for index, _ in errors] == [1, 2]
+
+def test_round2_matches_builtin_round():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([
+        rng.uniform(0, 1000, 20000),
+        rng.uniform(-50, 50, 5000),
+        rng.lognormal(0, 4, 5000),
+        # Decimal ties: exact .5 cents and values that only look like ties in binary
+        np.arange(0, 200000) / 1000 + 0.005,
+        np.array([0.125, 0.135, 1.005, 2.675, 0.285, 1.115, -0.125, -2.675, 0.0, 1e-9, 1e12 + 0.005]),
+    ])
+    assert _round2(values).tolist() == [round(value, 2) for value in values.tolist()]
+
+def test_batch_calculation_matches_scalar():
+    categories, subcategories, quantities = [], [], []
+    for category, factors in EMISSION_FACTORS.items():
+        for subcategory in factors:
+            for quantity in (0, 0.5, 1, 3.3, 12.345, 250, 1e6 / 7):
+                # Mixed case is accepted by both paths
+                categories.append(category.upper())
+                subcategories.append(subcategory)
+                quantities.append(quantity)
+    
+    co2, errors = calculate_emissions_batch(categories, subcategories, quantities)
+    assert not errors.any()
+    expected = [calculate_emissions(c, s, q) for c, s, q in zip(categories, subcategories, quantities)]
+    assert co2.tolist() == expected
+
+def test_batch_calculation_flags_unknown_pairs():
+    co2, errors = calculate_emissions_batch(["transport", "transport", "nuclear"], ["car", "rocket", "car"], [1, 1, 1])
+    assert errors.tolist() == [False, True, True]
+    assert co2.tolist()[1:] == [0.0, 0.0]
+    
+    co2, errors = calculate_emissions_batch([], [], [])
+    assert len(co2) == len(errors) == 0
@@ -0,0 +1,58 @@
+"""Emission history: keyset cursor paging and parameter checks."""
+
+import pytest
+
+from app.database import settings
+
+def _add_entries(client, headers, days):
+    items = [
+        {"category": "transport", "subcategory": "car", "quantity": 1 + i, "unit": "km", "date": day}
+        for i, day in enumerate(days)
+    ]
+    response = client.post("/api/emissions/batch", json=items, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["ids"]
+
+def _all_pages(client, headers, limit):
+    pages = []
+    params = {"limit": limit}
+    while True:
+        response = client.get("/api/emissions/history", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([entry["id"] for entry in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+        params = {"limit": limit, "cursor": cursor}
+
+@pytest.mark.parametrize("fast_json", [False, True])
+def test_cursor_pages_cover_every_entry_once(client, auth_headers, monkeypatch, fast_json):
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", fast_json)
+    # Repeated dates: ties are broken by created_at and id
+    ids = _add_entries(client, auth_headers, ["2025-03-01", "2025-03-02", "2025-03-02", "2025-03-03"] * 2)
+    
+    pages = _all_pages(client, auth_headers, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert sorted(sum(pages, [])) == sorted(ids)
+    
+    full = client.get("/api/emissions/history", params={"limit": 100}, headers=auth_headers)
+    assert "X-Next-Cursor" not in full.headers
+    assert [entry["id"] for entry in full.json()] == sum(pages, [])
+    dates = [entry["date"] for entry in full.json()]
+    assert dates == sorted(dates, reverse=True)
+
+def test_exact_last_page_has_no_cursor(client, auth_headers):
+    _add_entries(client, auth_headers, ["2025-03-01", "2025-03-02"])
+    response = client.get("/api/emissions/history", params={"limit": 2}, headers=auth_headers)
+    assert len(response.json()) == 2
+    assert "X-Next-Cursor" not in response.headers
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_limit_below_one_is_rejected(client, auth_headers, limit):
+    _add_entries(client, auth_headers, ["2025-03-01"])
+    response = client.get("/api/emissions/history", params={"limit": limit}, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_malformed_cursor_is_rejected(client, auth_headers):
+    response = client.get("/api/emissions/history", params={"cursor": "not-a-cursor"}, headers=auth_headers)
+    assert response.status_code == 400
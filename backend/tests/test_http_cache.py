@@ -0,0 +1,79 @@
+"""Conditional GETs: data_version ETags, 304s and compression."""
+
+from app.database import settings
+
+ENTRY = {"category": "transport", "subcategory": "car", "quantity": 10, "unit": "km", "date": "2025-03-01"}
+
+def _get(client, path, headers, **extra):
+    return client.get(path, headers={**headers, **extra})
+
+def test_etag_revalidates_until_data_changes(client, auth_headers):
+    first = _get(client, "/api/emissions/history", auth_headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    
+    not_modified = _get(client, "/api/emissions/history", auth_headers, **{"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.content == b""
+    
+    # A write bumps data_version, so the old ETag no longer matches
+    assert client.post("/api/emissions", json=ENTRY, headers=auth_headers).status_code == 200
+    changed = _get(client, "/api/emissions/history", auth_headers, **{"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 1
+
+def test_etag_depends_on_query_and_user(client, auth_headers):
+    history = _get(client, "/api/emissions/history", auth_headers).headers["ETag"]
+    filtered = client.get("/api/emissions/history", params={"category": "food"}, headers=auth_headers).headers["ETag"]
+    assert history != filtered
+    
+    email = "etag-other@example.com"
+    client.post("/api/auth/register", json={"email": email, "full_name": "Other", "password": "secret123"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "secret123"}).json()["access_token"]
+    other = _get(client, "/api/emissions/history", {"Authorization": f"Bearer {token}"}, **{"If-None-Match": history})
+    assert other.status_code == 200
+
+def test_profile_update_changes_etag(client, auth_headers):
+    etag = _get(client, "/api/profile", auth_headers).headers["ETag"]
+    assert client.put("/api/profile", json={"household_size": 3}, headers=auth_headers).status_code == 200
+    assert _get(client, "/api/profile", auth_headers, **{"If-None-Match": etag}).status_code == 200
+
+def test_non_get_and_anonymous_requests_get_no_etag(client, auth_headers):
+    assert "ETag" not in client.post("/api/emissions", json=ENTRY, headers=auth_headers).headers
+    assert client.get("/api/emissions/history").status_code in (401, 403)
+
+def test_compressed_catalog_gets_weak_etag(client):
+    identity = client.get("/api/recommendations/catalog", headers={"Accept-Encoding": "identity"})
+    strong = identity.headers["ETag"]
+    assert not strong.startswith("W/")
+    
+    compressed = client.get("/api/recommendations/catalog", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] == "W/" + strong
+    
+    # The weak form still revalidates
+    revalidated = client.get(
+        "/api/recommendations/catalog",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]}
+    )
+    assert revalidated.status_code == 304
+
+def test_compressed_data_etag_still_revalidates(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", False)
+    items = [dict(ENTRY, quantity=i + 1) for i in range(40)]
+    assert client.post("/api/emissions/batch", json=items, headers=auth_headers).status_code == 200
+    
+    response = client.get("/api/emissions/history", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert not etag.startswith('W/W/')
+    
+    revalidated = client.get(
+        "/api/emissions/history",
+        headers={**auth_headers, "Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert revalidated.status_code == 304
@@ -0,0 +1,47 @@
+"""Bulk import error paths."""
+
+import io
+
+from app.services.importer import iter_records
+
+VALID = b'{"category": "transport", "subcategory": "car", "quantity": 10, "unit": "km", "date": "2025-03-01"}\n'
+
+def _import(client, headers, body: bytes, filename: str = "data.ndjson", **params):
+    return client.post("/api/emissions/import", files={"file": (filename, body)}, params=params, headers=headers)
+
+def test_non_object_ndjson_lines_are_record_errors():
+    records = list(iter_records(io.BytesIO(b'5\nnull\n[1, 2]\n"text"\n{"a": 1}\n'), "ndjson"))
+    assert records[:4] == [{"__error__": "JSON line is not an object"}] * 4
+    assert records[4] == {"a": 1}
+
+def test_import_reports_non_object_lines(client, auth_headers):
+    response = _import(client, auth_headers, VALID + b"5\nnull\n" + VALID)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["created"] == 2
+    assert report["failed"] == 2
+    assert report["records_committed"] == 4
+    assert [error["index"] for error in report["errors"]] == [1, 2]
+
+def test_import_reports_invalid_records(client, auth_headers):
+    body = VALID + b"{not json\n" + b'{"category": "transport", "subcategory": "rocket", "quantity": 1, "unit": "km", "date": "2025-03-01"}\n' \
+        + b'{"category": "transport", "subcategory": "car", "quantity": 1, "unit": "km", "date": "03/01/2025"}\n' \
+        + b'{"category": "transport"}\n'
+    report = _import(client, auth_headers, body).json()
+    assert report["created"] == 1
+    details = {error["index"]: error["detail"] for error in report["errors"]}
+    assert details[1] == "Invalid JSON line"
+    assert "rocket" in details[2]
+    assert details[3] == "Invalid date format. Use YYYY-MM-DD"
+    assert "subcategory" in details[4]
+
+def test_import_csv_and_resume(client, auth_headers):
+    body = b"category,subcategory,quantity,unit,date\ntransport,car,10,km,2025-03-01\ntransport,bus,5,km,2025-03-02\n"
+    report = _import(client, auth_headers, body, filename="data.csv", resume_from=1).json()
+    assert report == {"records_committed": 2, "created": 1, "failed": 0, "chunks_committed": 1, "errors": []}
+    history = client.get("/api/emissions/history", headers=auth_headers).json()
+    assert [entry["subcategory"] for entry in history] == ["bus"]
+
+def test_import_rejects_unknown_format_and_encoding(client, auth_headers):
+    assert _import(client, auth_headers, VALID, filename="data.txt").status_code == 400
+    assert _import(client, auth_headers, b"\xff\xfe\x00", filename="data.csv").status_code == 400
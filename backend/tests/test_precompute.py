@@ -0,0 +1,31 @@
+"""Nightly recommendation precompute: resuming a day's run."""
+
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import PrecomputedRecommendation, User
+from app.services.precompute import _partition_bounds, _resume_after, precompute_range
+
+def test_resume_after_returns_last_written_user_per_range(client, auth_headers):
+    day = datetime.utcnow().date()
+    precompute_range(None, None, day, restart=True)
+    with Session(engine) as session:
+        user_ids = sorted(session.exec(select(User.id)).all(), key=lambda user_id: user_id.int)
+        for lower, upper in _partition_bounds(4):
+            in_range = [
+                user_id for user_id in user_ids
+                if (lower is None or user_id >= lower) and (upper is None or user_id < upper)
+            ]
+            assert _resume_after(session, day, lower, upper) == (in_range[-1] if in_range else None)
+        assert _resume_after(session, day.replace(year=day.year - 1), None, None) is None
+
+def test_second_run_of_the_day_resumes_past_everyone(client, auth_headers):
+    day = datetime.utcnow().date()
+    first = precompute_range(None, None, day, restart=True)
+    with Session(engine) as session:
+        assert first["users"] == len(session.exec(select(User.id)).all())
+        written = session.exec(select(PrecomputedRecommendation.user_id).where(PrecomputedRecommendation.day == day)).all()
+        assert len(written) == first["users"]
+    assert precompute_range(None, None, day)["users"] == 0
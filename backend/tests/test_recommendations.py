@@ -0,0 +1,66 @@
+"""Recommendation cache: the SQLite backend stays off the event loop."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services import recommendations
+from app.services.cache import SQLiteCache
+
+ENTRY = {"category": "transport", "subcategory": "car", "quantity": 500, "unit": "km"}
+
+def _entry() -> dict:
+    # Recommendations score the trailing 30 days
+    return {**ENTRY, "date": datetime.utcnow().date().isoformat()}
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+class RecordingSQLiteCache(SQLiteCache):
+    """SQLiteCache that notes, per call, whether it ran on an event loop thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def get(self, *args, **kwargs):
+        self.calls.append(("get", _on_event_loop()))
+        return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self.calls.append(("set", _on_event_loop()))
+        return super().set(*args, **kwargs)
+
+    def pop(self, *args, **kwargs):
+        self.calls.append(("pop", _on_event_loop()))
+        return super().pop(*args, **kwargs)
+
+@pytest.fixture
+def sqlite_cache(tmp_path, monkeypatch):
+    cache = RecordingSQLiteCache(str(tmp_path / "recommendations.db"), maxsize=100)
+    monkeypatch.setattr(recommendations, "recommendation_cache", cache)
+    return cache
+
+def test_sqlite_cache_calls_run_in_threadpool(client, auth_headers, sqlite_cache):
+    assert client.post("/api/emissions", json=_entry(), headers=auth_headers).status_code == 200
+    first = client.get("/api/recommendations", headers=auth_headers)
+    assert first.status_code == 200, first.text
+    # Served from the cache: the second lookup hits
+    second = client.get("/api/recommendations", headers=auth_headers)
+    assert second.json() == first.json()
+    assert sqlite_cache.hits == 1
+    
+    client.post("/api/emissions", json=_entry(), headers=auth_headers)
+    assert [name for name, _ in sqlite_cache.calls] == ["pop", "get", "set", "get", "pop"]
+    assert not any(on_loop for _, on_loop in sqlite_cache.calls)
+
+def test_recommendations_follow_new_entries(client, auth_headers, sqlite_cache):
+    before = client.get("/api/recommendations", headers=auth_headers).json()
+    client.post("/api/emissions", json=_entry(), headers=auth_headers)
+    after = client.get("/api/recommendations", headers=auth_headers).json()
+    assert after != before
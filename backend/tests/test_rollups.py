@@ -0,0 +1,68 @@
+"""Daily rollups stay equal to a fresh aggregate of raw entries after every write path."""
+
+from uuid import UUID
+
+import pytest
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import EmissionDailyRollup
+from app.services.rollups import check_rollups, rebuild_rollups
+
+def _entry(subcategory="car", quantity=10, day="2025-03-01", category="transport"):
+    return {"category": category, "subcategory": subcategory, "quantity": quantity, "unit": "km", "date": day}
+
+@pytest.fixture
+def user_id(client, auth_headers) -> UUID:
+    return UUID(client.get("/api/profile", headers=auth_headers).json()["user"]["id"])
+
+def _rollups(user_id: UUID) -> dict:
+    with Session(engine) as session:
+        assert check_rollups(session, user_id) == []
+        rows = session.exec(select(EmissionDailyRollup).where(EmissionDailyRollup.user_id == user_id))
+        return {(row.day.isoformat(), row.category): (round(row.co2_total, 2), row.entry_count) for row in rows}
+
+def test_rollups_follow_every_write(client, auth_headers, user_id):
+    created = client.post("/api/emissions", json=_entry(), headers=auth_headers).json()
+    assert _rollups(user_id) == {("2025-03-01", "transport"): (created["co2_equivalent"], 1)}
+    
+    batch = client.post("/api/emissions/batch", json=[_entry(quantity=5), _entry(day="2025-03-02")], headers=auth_headers)
+    assert batch.json()["created"] == 2
+    body = b'{"category": "transport", "subcategory": "bus", "quantity": 20, "unit": "km", "date": "2025-03-02"}\n'
+    assert client.post("/api/emissions/import", files={"file": ("d.ndjson", body)}, headers=auth_headers).json()["created"] == 1
+    rollups = _rollups(user_id)
+    assert rollups[("2025-03-01", "transport")][1] == 2
+    assert rollups[("2025-03-02", "transport")][1] == 2
+    
+    # Moving an entry to another day and category moves its delta with it
+    update = {"category": "food", "subcategory": "beef", "quantity": 1, "unit": "kg", "date": "2025-03-05"}
+    assert client.put(f"/api/emissions/{created['id']}", json=update, headers=auth_headers).status_code == 200
+    rollups = _rollups(user_id)
+    assert rollups[("2025-03-01", "transport")][1] == 1
+    assert rollups[("2025-03-05", "food")][1] == 1
+    
+    # Deleting the last entry of a (day, category) removes its rollup row
+    assert client.delete(f"/api/emissions/{created['id']}", headers=auth_headers).status_code == 204
+    assert ("2025-03-05", "food") not in _rollups(user_id)
+
+def test_rebuild_matches_incremental_rollups(client, auth_headers, user_id):
+    items = [_entry(quantity=q, day=f"2025-04-{d:02d}") for q in (1.25, 3.5, 7.75) for d in (1, 2, 3)]
+    client.post("/api/emissions/batch", json=items, headers=auth_headers)
+    incremental = _rollups(user_id)
+    with Session(engine) as session:
+        assert rebuild_rollups(session, user_id) == len(incremental)
+    assert _rollups(user_id) == incremental
+
+def test_breakdown_reads_rollups(client, auth_headers, user_id):
+    march = [_entry(quantity=10, day="2025-03-10"), _entry(category="food", subcategory="beef", quantity=1, day="2025-03-11")]
+    february = [_entry(quantity=5, day="2025-02-10")]
+    client.post("/api/emissions/batch", json=march + february, headers=auth_headers)
+    rollups = _rollups(user_id)
+    
+    breakdown = client.get("/api/emissions/breakdown", params={"year": 2025, "month": 3}, headers=auth_headers).json()
+    assert breakdown["breakdown"]["transport"] == rollups[("2025-03-10", "transport")][0]
+    assert breakdown["breakdown"]["food"] == rollups[("2025-03-11", "food")][0]
+    assert len(breakdown["entries"]) == 2
+    previous = rollups[("2025-02-10", "transport")][0]
+    total = breakdown["summary"]["total_co2_kg"]
+    assert breakdown["summary"]["trend"] == round((total - previous) / previous * 100, 1)